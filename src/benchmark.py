@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+benchmark: Times the load, resolve, build and render stages of dabsVisualizer.
+
+Each stage is timed separately. Peak memory per stage is measured with tracemalloc in an
+extra run, because tracing slows Python down too much to time the same run. Bundles are
+either generated with bundleGenerator for each requested size, or an existing
+databricks.yml is measured. Rendering goes through the warm renderer pool with fakeRenderer.py
+standing in for PlantUML/Mermaid, so no external tools or Databricks workspace are
+needed and the numbers show the tool's own overhead.
+
+Examples:
+    python src/benchmark.py --sizes 10,100,1000 --tasks 20 --targets 6
+    python src/benchmark.py --bundle example-advanced/databricks.yml --repeat 5 --json results.json
+"""
+
+import sys
+import os
+import time
+import json
+import argparse
+import tempfile
+import tracemalloc
+
+import dabsVisualizer
+from bundleGenerator import generate_bundle
+
+FAKE_RENDERER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakeRenderer.py")
+STAGES = ("load", "resolve", "build", "render")
+
+def benchmark_bundle(main_yaml_path, diagram_type="mermaid", workers=1, render=True, trace_memory=False):
+    """
+    Runs every stage once on the bundle and returns {stage: (seconds, peak bytes)}
+    plus the number of jobs, tasks and targets. Peak bytes is None unless
+    trace_memory is set.
+    """
+    def measure(func):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = func()
+            seconds = time.perf_counter() - start
+            return result, seconds, tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+
+    results = {}
+    def load():
+        bundle_name, resources, targets, variables = dabsVisualizer.load_bundle_yaml(main_yaml_path, workers=workers, merge_policies={})
+        return dabsVisualizer.BundleGraph(bundle_name, resources), resources, targets, variables
+    (graph, resources, targets, variables), *results["load"] = measure(load)
+
+    # The same steps as process_target: resolve only the target section, let
+    # the target graph resolve the jobs it draws through a fresh interpolator
+    # and fingerprint them; build then emits from the resolved target graphs
+    def resolve():
+        target_graphs = {}
+        for target_name, target_data in targets.items():
+            interpolator = dabsVisualizer.create_interpolator(graph.bundle_name, target_name, target_data, variables)
+            target_graph = graph.for_target(target_name, interpolator.resolve(target_data), interpolator)
+            dabsVisualizer.job_fingerprints(target_graph)
+            target_graphs[target_name] = target_graph
+        return target_graphs
+    target_graphs, *results["resolve"] = measure(resolve)
+
+    emit = {
+        "plantuml": dabsVisualizer.emit_plantuml,
+        "mermaid": dabsVisualizer.emit_mermaid,
+        "svg": dabsVisualizer.emit_svg,
+    }[diagram_type]
+    def build():
+        return {target_name: emit(target_graph) for target_name, target_graph in target_graphs.items()}
+    diagrams, *results["build"] = measure(build)
+
+    if render and diagram_type != "svg":
+        def render_all():
+            pool = dabsVisualizer.create_renderer_pool(diagram_type, workers, f'"{sys.executable}" "{FAKE_RENDERER}"')
+            try:
+                return [len(pool.render(content)) for content in diagrams.values()]
+            finally:
+                pool.close()
+        _, *results["render"] = measure(render_all)
+
+    jobs = resources.get("jobs") or {}
+    counts = {
+        "jobs": len(jobs),
+        "tasks": sum(len(job.get("tasks") or []) for job in jobs.values()),
+        "targets": len(targets),
+    }
+    return results, counts
+
+def summarize(runs, memory_run):
+    """Keeps the fastest time per stage over the timed runs and the peak memory of the traced run."""
+    summary = {}
+    for stage in STAGES:
+        timings = [run[stage][0] for run in runs if stage in run]
+        if timings:
+            summary[stage] = {
+                "seconds": min(timings),
+                "peak_mb": memory_run[stage][1] / (1024 * 1024),
+            }
+    return summary
+
+def print_table(rows):
+    header = f"{'bundle':<28}{'jobs':>7}{'tasks':>8}{'targets':>8}"
+    for stage in STAGES:
+        header += f"{stage + ' s':>12}{stage + ' MB':>12}"
+    print(header)
+    for row in rows:
+        line = f"{row['bundle']:<28}{row['jobs']:>7}{row['tasks']:>8}{row['targets']:>8}"
+        for stage in STAGES:
+            stats = row["stages"].get(stage)
+            if stats:
+                line += f"{stats['seconds']:>12.4f}{stats['peak_mb']:>12.2f}"
+            else:
+                line += f"{'-':>12}{'-':>12}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the load, resolve, build and render stages of dabsVisualizer."
+    )
+    parser.add_argument("--bundle", help="Benchmark an existing databricks.yml instead of generated bundles", default=None)
+    parser.add_argument("--sizes", help="Comma separated job counts of the generated bundles (default: 10,100,1000)", default="10,100,1000")
+    parser.add_argument("--files", help="Include files per generated bundle, 0 for one per 4 jobs (default: 0)", default=0, type=int)
+    parser.add_argument("--tasks", help="Tasks per job (default: 10)", default=10, type=int)
+    parser.add_argument("--targets", help="Targets per generated bundle (default: 3)", default=3, type=int)
+    parser.add_argument("--variables", help="Variables per generated bundle (default: 20)", default=20, type=int)
+    parser.add_argument(
+        "-t", "--type",
+        help="Diagram type to build and render (default: mermaid)",
+        default="mermaid",
+        choices=["mermaid", "plantuml", "svg"]
+    )
+    parser.add_argument("-j", "--jobs", help="Workers for parsing and rendering (default: 1)", default=1, type=int)
+    parser.add_argument("--repeat", help="Timed runs per bundle; the fastest time is reported (default: 3)", default=3, type=int)
+    parser.add_argument("--no-render", help="Skip the render stage", action="store_true")
+    parser.add_argument("--json", help="Also write the results as JSON to this file", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dabs_benchmark_") as work_dir:
+        if args.bundle:
+            bundles = [(os.path.basename(os.path.dirname(os.path.abspath(args.bundle))) or args.bundle, args.bundle)]
+        else:
+            bundles = []
+            for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+                files = args.files or max(1, size // 4)
+                path = generate_bundle(
+                    os.path.join(work_dir, f"bundle_{size}"), files, size, args.tasks, args.targets, args.variables
+                )
+                bundles.append((f"synthetic_{size}", path))
+
+        rows = []
+        for label, path in bundles:
+            runs = []
+            counts = {}
+            for _ in range(max(1, args.repeat)):
+                run, counts = benchmark_bundle(path, args.type, max(1, args.jobs), not args.no_render)
+                runs.append(run)
+            memory_run, _ = benchmark_bundle(path, args.type, max(1, args.jobs), not args.no_render, trace_memory=True)
+            rows.append({"bundle": label, **counts, "stages": summarize(runs, memory_run)})
+
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"type": args.type, "workers": args.jobs, "results": rows}, f, indent=2)
+        print(f"[INFO] Results saved to: {os.path.abspath(args.json)}")
+
+if __name__ == "__main__":
+    main()
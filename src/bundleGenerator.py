@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+bundleGenerator: Writes synthetic Databricks asset bundles for benchmarking dabsVisualizer.
+
+The generated tree has a databricks.yml with K targets and V variables, and N include
+files under resources/ holding J jobs with T tasks each. Task dependencies mimic real
+workflows: most tasks depend on one or two recent tasks, a few fan out from or fan in
+to hub tasks. Some jobs are spread over two include files to exercise the merge step.
+Output is deterministic for a given --seed.
+
+Example:
+    python src/bundleGenerator.py -o /tmp/bundle --files 50 --jobs 200 --tasks 20 --targets 6 --variables 30
+"""
+
+import os
+import argparse
+import random
+import yaml
+
+def generate_bundle(output_dir, files=10, jobs=20, tasks=10, targets=3, variables=10, seed=0):
+    """
+    Writes a synthetic bundle to output_dir and returns the path of its databricks.yml.
+    """
+    rng = random.Random(seed)
+    files = max(1, files)
+    variable_names = [f"var_{number}" for number in range(variables)]
+
+    bundle = {
+        "bundle": {"name": "synthetic_bundle"},
+        "include": ["resources/**/*.yml"],
+        "variables": {
+            name: {
+                "description": f"Synthetic variable {number}",
+                # Some defaults reference other variables or the target, like real bundles do
+                "default": (
+                    f"${{bundle.target}}-{name}" if number % 3 == 0
+                    else f"${{var.{variable_names[number - 1]}}}/{name}" if number % 3 == 1
+                    else f"value-{number}"
+                ),
+            }
+            for number, name in enumerate(variable_names)
+        },
+        "targets": {},
+    }
+    for number in range(targets):
+        overrides = {name: f"target-{number}-{name}" for name in rng.sample(variable_names, len(variable_names) // 2)}
+        bundle["targets"][f"target_{number}"] = {
+            "mode": "development" if number == 0 else "production",
+            "default": number == 0,
+            "workspace": {"host": f"https://adb-{number:04d}.azuredatabricks.net"},
+            "variables": overrides,
+        }
+
+    file_resources = [{} for _ in range(files)]
+    for job_number in range(jobs):
+        job_id = f"job_{job_number}"
+        job_tasks = [generate_task(rng, job_number, task_number, variable_names) for task_number in range(tasks)]
+        clusters = [
+            {
+                "job_cluster_key": f"cluster_{cluster_number}",
+                "new_cluster": {
+                    "spark_version": rng.choice(["13.3.x-scala2.12", "14.3.x-scala2.12", "15.4.x-scala2.12"]),
+                    "node_type_id": rng.choice(["m7g.large", "m7g.xlarge", "Standard_D3_v2"]),
+                    "num_workers": rng.randint(0, 8),
+                    "runtime_engine": rng.choice(["STANDARD", "PHOTON"]),
+                },
+            }
+            for cluster_number in range(1 + tasks // 10)
+        ]
+        for task in job_tasks:
+            task["job_cluster_key"] = rng.choice(clusters)["job_cluster_key"]
+        job = {
+            "name": f"${{bundle.target}}-{job_id}",
+            "email_notifications": {"on_failure": [f"team-{job_number % 7}@company.com"]},
+            "trigger": {"periodic": {"interval": rng.randint(1, 24), "unit": "HOURS"}},
+            "job_clusters": clusters,
+            "tasks": job_tasks,
+        }
+        file_number = job_number % files
+        if job_number % 10 == 9 and files > 1 and len(job_tasks) > 1:
+            # Spread this job over two files: the second one adds the later tasks
+            split = len(job_tasks) // 2
+            second_half = {"tasks": job_tasks[split:], "job_clusters": clusters}
+            job["tasks"] = job_tasks[:split]
+            file_resources[(file_number + 1) % files].setdefault("jobs", {})[job_id] = second_half
+        file_resources[file_number].setdefault("jobs", {})[job_id] = job
+
+    os.makedirs(output_dir, exist_ok=True)
+    for file_number, resources in enumerate(file_resources):
+        # Nest some files in subdirectories to exercise '**' includes
+        subdirectory = os.path.join(output_dir, "resources", f"group_{file_number % 4}")
+        os.makedirs(subdirectory, exist_ok=True)
+        with open(os.path.join(subdirectory, f"resources_{file_number}.yml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump({"resources": resources}, f, sort_keys=False)
+
+    main_yaml_path = os.path.join(output_dir, "databricks.yml")
+    with open(main_yaml_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(bundle, f, sort_keys=False)
+    return main_yaml_path
+
+def generate_task(rng, job_number, task_number, variable_names):
+    """
+    Generates one task. Dependencies point backwards only, so the task graph is
+    a DAG: usually one or two of the five previous tasks, sometimes a hub task
+    (fan-out) or many previous tasks at once (fan-in).
+    """
+    task = {"task_key": f"task_{task_number}"}
+    if task_number > 0:
+        roll = rng.random()
+        if roll < 0.1:
+            depends_on = [0]
+        elif roll < 0.15:
+            depends_on = rng.sample(range(task_number), min(task_number, rng.randint(3, 8)))
+        else:
+            window = range(max(0, task_number - 5), task_number)
+            depends_on = rng.sample(window, min(len(window), rng.randint(1, 2)))
+        task["depends_on"] = [{"task_key": f"task_{dependency}"} for dependency in sorted(depends_on)]
+
+    if task_number % 4 == 3:
+        task["python_wheel_task"] = {"package_name": f"package_{job_number}", "entry_point": "main"}
+    else:
+        parameters = {"env": "${bundle.target}"}
+        for name in rng.sample(variable_names, min(len(variable_names), 3)):
+            parameters[name] = f"${{var.{name}}}"
+        task["notebook_task"] = {
+            "notebook_path": f"../notebooks/job_{job_number}/task_{task_number}.py",
+            "base_parameters": parameters,
+        }
+    return task
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic Databricks asset bundle for benchmarking dabsVisualizer."
+    )
+    parser.add_argument("-o", "--output", help="Directory to write the bundle to", required=True)
+    parser.add_argument("--files", help="Number of include files (default: 10)", default=10, type=int)
+    parser.add_argument("--jobs", help="Number of jobs (default: 20)", default=20, type=int)
+    parser.add_argument("--tasks", help="Number of tasks per job (default: 10)", default=10, type=int)
+    parser.add_argument("--targets", help="Number of targets (default: 3)", default=3, type=int)
+    parser.add_argument("--variables", help="Number of variables (default: 10)", default=10, type=int)
+    parser.add_argument("--seed", help="Random seed (default: 0)", default=0, type=int)
+    args = parser.parse_args()
+
+    main_yaml_path = generate_bundle(
+        args.output, args.files, args.jobs, args.tasks, args.targets, args.variables, args.seed
+    )
+    print(f"[INFO] Synthetic bundle written to: {os.path.abspath(main_yaml_path)}")
+
+if __name__ == "__main__":
+    main()
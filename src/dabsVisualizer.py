@@ -9,6 +9,7 @@ Changes from the previous version:
 """
 
 import sys
+import time
 import yaml
 import glob
 import os
@@ -16,76 +17,934 @@ import argparse
 import subprocess
 import tempfile
 import shutil
+import re
+import pickle
 import json
+import abc
+import base64
+import datetime
+import hashlib
+import shlex
+import queue
+import threading
+import select
+import collections
+import fnmatch
+import cProfile
+import pstats
+import html
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-def load_bundle_yaml(main_yaml_path):
+from svgLayout import LayoutNode, emit_svg_components
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "dabs_visualizer"
+)
+
+# libyaml's C loader is much faster than the pure-Python one; use it when PyYAML was built with it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+# Bump when the layout of cached YAML entries changes
+YAML_CACHE_FORMAT = 2
+# Key of the JSON objects that stand for YAML values JSON has no type for
+YAML_CACHE_TAG = "!yaml"
+
+def _encode_yaml_value(value):
+    """
+    Turns a document parsed with YamlLoader into plain JSON values. Dates,
+    timestamps, binary, sets, pairs and mappings with keys other than strings
+    (or with YAML_CACHE_TAG as a key) become objects tagged with YAML_CACHE_TAG.
+    """
+    if isinstance(value, dict):
+        if YAML_CACHE_TAG not in value and all(isinstance(key, str) for key in value):
+            return {key: _encode_yaml_value(item) for key, item in value.items()}
+        return {
+            YAML_CACHE_TAG: "map",
+            "items": [[_encode_yaml_value(key), _encode_yaml_value(item)] for key, item in value.items()],
+        }
+    if isinstance(value, list):
+        return [_encode_yaml_value(item) for item in value]
+    # datetime before date, a datetime is a date as well
+    if isinstance(value, datetime.datetime):
+        return {YAML_CACHE_TAG: "datetime", "value": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {YAML_CACHE_TAG: "date", "value": value.isoformat()}
+    if isinstance(value, bytes):
+        return {YAML_CACHE_TAG: "bytes", "value": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, (set, tuple)):
+        kind = "set" if isinstance(value, set) else "tuple"
+        return {YAML_CACHE_TAG: kind, "items": [_encode_yaml_value(item) for item in value]}
+    return value
+
+def _decode_yaml_object(obj):
+    """
+    json object_hook undoing _encode_yaml_value() for one object.
+    """
+    tag = obj.get(YAML_CACHE_TAG)
+    if tag is None:
+        return obj
+    if tag == "map":
+        return {key: item for key, item in obj["items"]}
+    if tag == "datetime":
+        return datetime.datetime.fromisoformat(obj["value"])
+    if tag == "date":
+        return datetime.date.fromisoformat(obj["value"])
+    if tag == "bytes":
+        return base64.b64decode(obj["value"])
+    if tag == "set":
+        return set(obj["items"])
+    if tag == "tuple":
+        return tuple(obj["items"])
+    raise ValueError(f"Unknown cache entry tag '{tag}'")
+
+class YamlCache:
+    """
+    On-disk cache of parsed YAML documents. Each file gets one JSON entry,
+    named after the hash of its absolute path, holding the file's mtime, size,
+    content hash and parsed document. An entry is used as-is when mtime and
+    size still match, and also when only the mtime changed but the content
+    hash is the same (e.g. after a fresh checkout in CI). Entries are plain
+    data, so a cache directory shared with untrusted builds cannot run code.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _entry_path(self, path):
+        return os.path.join(self.directory, hashlib.sha256(path.encode("utf-8")).hexdigest() + ".json")
+
+    def _read_entry(self, entry_path):
+        try:
+            with open(entry_path, "rb") as f:
+                entry = json.load(f, object_hook=_decode_yaml_object)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if not isinstance(entry, dict) or entry.get("format") != YAML_CACHE_FORMAT:
+            return None
+        return entry
+
+    def load(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry_path = self._entry_path(path)
+        entry = self._read_entry(entry_path)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["data"]
+
+        with open(path, "rb") as f:
+            content = f.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        if entry and entry["sha256"] == content_hash:
+            data = entry["data"]
+        else:
+            data = yaml.load(content, Loader=YamlLoader)
+        entry = {
+            "format": YAML_CACHE_FORMAT,
+            "path": path,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": content_hash,
+            "data": _encode_yaml_value(data),
+        }
+        write_atomic(entry_path, json.dumps(entry, separators=(",", ":")).encode("utf-8"))
+        return data
+
+def parse_yaml_file(path, yaml_cache=None):
+    """
+    Parses a YAML file, going through the on-disk cache if one is given.
+    """
+    if yaml_cache is not None:
+        return yaml_cache.load(path)
+    with open(path, "rb") as f:
+        return yaml.load(f, Loader=YamlLoader)
+
+# Below this many include files a process pool costs more than it saves
+PARALLEL_PARSE_MIN_FILES = 16
+
+def expand_includes(main_dir, include_patterns):
+    """
+    Expands all include patterns (with '**' support) relative to main_dir into
+    one ordered list of files. Matches of each pattern are sorted, patterns are
+    applied in the order they are listed, and a file matched by several
+    patterns is only included the first time.
+    """
+    resource_files = []
+    seen = set()
+    for pattern in include_patterns:
+        pattern_path = os.path.join(main_dir, pattern)
+        for resource_file in sorted(glob.glob(pattern_path, recursive=True)):
+            real_path = os.path.realpath(resource_file)
+            if real_path in seen or not os.path.isfile(real_path):
+                continue
+            seen.add(real_path)
+            resource_files.append(resource_file)
+    return resource_files
+
+def _parse_include(resource_file, yaml_cache):
+    """
+    Parses a single include file. Runs in a worker, so errors are returned
+    instead of raised. Returns a (resource_file, data, error, seconds) tuple.
+    """
+    start = time.perf_counter()
+    try:
+        data, error = parse_yaml_file(resource_file, yaml_cache), None
+    except Exception as e:
+        data, error = None, str(e)
+    return resource_file, data, error, time.perf_counter() - start
+
+def parse_includes(resource_files, yaml_cache=None, workers=1, executor=None):
+    """
+    Parses the include files, on a process pool if there are enough of them to
+    be worth it. YAML construction holds the GIL, so threads would not help.
+    A running executor shared by several bundles can be passed in; it has no
+    startup cost left, so it is used for any number of files.
+    Results are returned in the order of resource_files.
+    """
+    if executor is not None and len(resource_files) > 1:
+        chunksize = max(1, len(resource_files) // (max(1, workers) * 4))
+        return list(executor.map(
+            _parse_include, resource_files, [yaml_cache] * len(resource_files), chunksize=chunksize
+        ))
+    if workers > 1 and len(resource_files) >= PARALLEL_PARSE_MIN_FILES:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(resource_files) // (workers * 4))
+            return list(executor.map(
+                _parse_include, resource_files, [yaml_cache] * len(resource_files), chunksize=chunksize
+            ))
+    return [_parse_include(resource_file, yaml_cache) for resource_file in resource_files]
+
+MERGE_POLICIES = ("merge", "override", "keep", "error")
+# Policy per resource type when the same resource key is defined in more than one
+# file; "*" applies to all other types. "merge" deep-merges the definitions,
+# "override" lets the later file win, "keep" keeps the first one and "error" aborts.
+DEFAULT_MERGE_POLICIES = {"jobs": "merge", "*": "override"}
+# Lists whose items are identified by a key field and merged item by item
+KEYED_LISTS = {
+    "tasks": "task_key",
+    "job_clusters": "job_cluster_key",
+    "environments": "environment_key",
+    "clusters": "label",
+}
+
+class MergeConflictError(Exception):
+    """Raised when a resource is redefined and its merge policy is 'error'."""
+
+class ResourceMerger:
+    """
+    Merges the resources of all include files into one dictionary.
+
+    Items of keyed lists (tasks, job_clusters, environments, ...) are looked up
+    through dict indexes on their key field, which are kept for the lifetime of
+    the merge, so merging stays linear in the number of items even when a job
+    is spread over many files. Conflicting values are reported together with
+    the files they came from; for "merge", the first value is kept.
+    """
+    def __init__(self, policies=None, log=print):
+        self.policies = dict(DEFAULT_MERGE_POLICIES)
+        self.policies.update(policies or {})
+        self.log = log
+        self.resources = {}
+        self.conflicts = []
+        # id(list) -> {item key: item}, for keyed lists in self.resources
+        self._indexes = {}
+        # (resource_type, key) or id(list item) -> file the definition came from
+        self._origins = {}
+
+    def policy(self, resource_type):
+        return self.policies.get(resource_type, self.policies.get("*", "override"))
+
+    def add(self, resources, source_file):
+        """Merges the 'resources' mapping of one include file."""
+        for resource_type, items in resources.items():
+            merged_items = self.resources.setdefault(resource_type, {})
+            policy = self.policy(resource_type)
+            for key, value in (items or {}).items():
+                origin_key = (resource_type, key)
+                if key not in merged_items:
+                    merged_items[key] = value
+                    self._origins[origin_key] = source_file
+                    continue
+
+                origin = self._origins[origin_key]
+                path = f"{resource_type}.{key}"
+                if policy == "merge":
+                    merged_items[key] = self._merge_value(merged_items[key], value, path, None, origin, source_file)
+                    continue
+                if merged_items[key] == value:
+                    continue
+                if policy == "error":
+                    raise MergeConflictError(f"{path} is defined in both {origin} and {source_file}")
+                if policy == "override":
+                    self._conflict(path, origin, source_file, source_file)
+                    merged_items[key] = value
+                    self._origins[origin_key] = source_file
+                else:
+                    self._conflict(path, origin, source_file, origin)
+
+    def _merge_value(self, existing, new, path, field, origin, source_file):
+        if isinstance(existing, dict) and isinstance(new, dict):
+            for key, value in new.items():
+                if key in existing:
+                    existing[key] = self._merge_value(existing[key], value, f"{path}.{key}", key, origin, source_file)
+                else:
+                    existing[key] = value
+            return existing
+        if isinstance(existing, list) and isinstance(new, list) and field in KEYED_LISTS:
+            self._merge_keyed_list(existing, new, KEYED_LISTS[field], path, origin, source_file)
+            return existing
+        if existing != new:
+            self._conflict(path, origin, source_file, origin)
+        return existing
+
+    def _merge_keyed_list(self, existing, new, key_field, path, origin, source_file):
+        index = self._indexes.get(id(existing))
+        if index is None:
+            index = {}
+            for item in existing:
+                if isinstance(item, dict) and item.get(key_field) is not None:
+                    index.setdefault(item[key_field], item)
+            self._indexes[id(existing)] = index
+
+        for item in new:
+            item_key = item.get(key_field) if isinstance(item, dict) else None
+            if item_key is None:
+                existing.append(item)
+                continue
+            if item_key in index:
+                existing_item = index[item_key]
+                self._merge_value(
+                    existing_item, item, f"{path}[{item_key}]", None,
+                    self._origins.get(id(existing_item), origin), source_file
+                )
+            else:
+                existing.append(item)
+                index[item_key] = item
+                self._origins[id(item)] = source_file
+
+    def _conflict(self, path, origin, source_file, kept):
+        self.conflicts.append((path, origin, source_file))
+        self.log(f"[WARNING] Merge conflict in {path}: defined in {origin} and {source_file}, keeping {kept}")
+
+def parse_merge_policies(specs):
+    """
+    Parses '--merge-policy TYPE=POLICY' values into a {resource type: policy} dict.
+    """
+    policies = {}
+    for spec in specs or []:
+        resource_type, _, policy = spec.partition("=")
+        if not resource_type or policy not in MERGE_POLICIES:
+            raise ValueError(f"Invalid merge policy '{spec}', expected TYPE=POLICY with POLICY one of {', '.join(MERGE_POLICIES)}")
+        policies[resource_type] = policy
+    return policies
+
+def merge_include(merger, resource_file, resource_yaml, error=None):
+    """
+    Adds the resources of one parsed include file to the merger. Files that
+    failed to parse or merge are reported and skipped; merge conflicts under
+    the "error" policy are raised.
+    """
+    if error is not None:
+        print(f"[WARNING] Failed to load {resource_file}: {error}")
+        return
+    if not resource_yaml:
+        return
+    try:
+        merger.add(resource_yaml.get("resources") or {}, resource_file)
+    except MergeConflictError:
+        raise
+    except Exception as e:
+        print(f"[WARNING] Failed to load {resource_file}: {e}")
+
+def load_bundle_yaml(main_yaml_path, yaml_cache=None, workers=1, merge_policies=None, timings=None, executor=None):
     """
     Loads the main databricks.yml file, extracts the bundle name and targets,
     and then loads all YAML resource files specified in the 'include' list.
     Merges resource definitions into one dictionary (e.g. all_resources["jobs"]).
-    
-    For resource type "jobs", if the same job key appears in more than one file,
-    then its "tasks" and "job_clusters" arrays are merged (with duplicate clusters eliminated).
+
+    Loading happens in three stages: the include patterns are expanded into a
+    deduplicated, ordered file list, the files are parsed (in parallel when
+    workers > 1 or on the shared process pool executor), and the results are
+    merged in file order, so the outcome is the same as a serial load. Parsed
+    files are taken from yaml_cache when one is given.
+
+    Resources defined in more than one file are combined according to
+    merge_policies (see DEFAULT_MERGE_POLICIES and ResourceMerger); by default
+    jobs are merged, with tasks and job_clusters combined by their keys.
+
+    If a timings dict is given, the parse time of every file is recorded in
+    timings["files"] and the time of the whole load in timings["load_seconds"].
+    Raises ValueError if databricks.yml is empty or not a mapping.
     """
-    with open(main_yaml_path, "r", encoding="utf-8") as f:
-        bundle_data = yaml.safe_load(f)
+    load_start = time.perf_counter()
+    bundle_data = parse_yaml_file(main_yaml_path, yaml_cache)
+    main_seconds = time.perf_counter() - load_start
+    if not isinstance(bundle_data, dict):
+        raise ValueError(f"{main_yaml_path} is empty or not a YAML mapping")
     
     bundle_name = bundle_data.get("bundle", {}).get("name", "unknown_bundle")
     targets = bundle_data.get("targets", {})
     variables = bundle_data.get("variables", {})
-    all_resources = {}
+    merger = ResourceMerger(merge_policies)
     
     main_dir = os.path.dirname(os.path.abspath(main_yaml_path))
-    include_patterns = bundle_data.get("include", [])
-    
-    for pattern in include_patterns:
-        pattern_path = os.path.join(main_dir, pattern)
-        for resource_file in glob.glob(pattern_path):
-            try:
-                with open(resource_file, "r", encoding="utf-8") as rf:
-                    resource_yaml = yaml.safe_load(rf)
-                if not resource_yaml:
+    resource_files = expand_includes(main_dir, bundle_data.get("include", []))
+
+    file_timings = [{"path": main_yaml_path, "seconds": main_seconds}]
+    for resource_file, resource_yaml, error, seconds in parse_includes(resource_files, yaml_cache, workers, executor):
+        file_timings.append({"path": resource_file, "seconds": seconds})
+        merge_include(merger, resource_file, resource_yaml, error)
+    if timings is not None:
+        timings["files"] = file_timings
+        timings["load_seconds"] = time.perf_counter() - load_start
+    return bundle_name, merger.resources, targets, variables
+
+# Seconds the watched files have to stay unchanged before --watch rebuilds,
+# so that a burst of saves (or a checkout) triggers a single rebuild
+WATCH_DEBOUNCE_SECONDS = 0.3
+
+class BundleState:
+    """
+    The parsed files of a bundle, kept in memory between rebuilds by --watch.
+    refresh() reparses only the files whose mtime or size changed since the
+    last call and picks up files added to or removed from the includes;
+    load() merges the parsed files again, with the same result as
+    load_bundle_yaml(). Documents are kept pickled because merging modifies
+    them in place.
+    """
+    def __init__(self, main_yaml_path, yaml_cache=None, merge_policies=None, workers=1):
+        self.main_yaml_path = main_yaml_path
+        self.yaml_cache = yaml_cache
+        self.merge_policies = merge_policies
+        self.workers = workers
+        self.main_data = {}
+        self.resource_files = []
+        # path -> ((mtime_ns, size), pickled document, parse error)
+        self._files = {}
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def stamps(self):
+        """Returns the (mtime_ns, size) of databricks.yml and of every file its includes match now."""
+        main_dir = os.path.dirname(os.path.abspath(self.main_yaml_path))
+        paths = [self.main_yaml_path] + expand_includes(main_dir, self.main_data.get("include") or [])
+        return {path: self._stamp(path) for path in paths}
+
+    def refresh(self):
+        """
+        Reparses databricks.yml and the included files that changed. Returns
+        the paths of the files that were added, changed or removed.
+        """
+        changed = []
+        main_stamp = self._stamp(self.main_yaml_path)
+        main_entry = self._files.get(self.main_yaml_path)
+        if main_entry is None or main_entry[0] != main_stamp or main_stamp is None:
+            _, data, error, _ = _parse_include(self.main_yaml_path, self.yaml_cache)
+            if error is None and not isinstance(data, dict):
+                error = f"{self.main_yaml_path} is empty or not a YAML mapping"
+            if error is None:
+                self.main_data = data
+            self._files[self.main_yaml_path] = (main_stamp, None, error)
+            changed.append(self.main_yaml_path)
+
+        main_dir = os.path.dirname(os.path.abspath(self.main_yaml_path))
+        resource_files = expand_includes(main_dir, self.main_data.get("include") or [])
+        stamps = {path: self._stamp(path) for path in resource_files}
+        stale = [path for path in resource_files if path not in self._files or self._files[path][0] != stamps[path]]
+        for resource_file, data, error, _ in parse_includes(stale, self.yaml_cache, self.workers):
+            self._files[resource_file] = (stamps[resource_file], pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), error)
+        changed.extend(stale)
+
+        current = set(resource_files)
+        for path in self.resource_files:
+            if path not in current:
+                del self._files[path]
+                changed.append(path)
+        self.resource_files = resource_files
+        return changed
+
+    def load(self):
+        """
+        Merges the parsed files. Returns (bundle_name, resources, targets,
+        variables) like load_bundle_yaml(); raises ValueError if databricks.yml
+        could not be parsed.
+        """
+        main_error = self._files[self.main_yaml_path][2]
+        if main_error is not None:
+            raise ValueError(f"Failed to load {self.main_yaml_path}: {main_error}")
+        merger = ResourceMerger(self.merge_policies)
+        for resource_file in self.resource_files:
+            _, document, error = self._files[resource_file]
+            merge_include(merger, resource_file, None if error is not None else pickle.loads(document), error)
+        bundle_name = self.main_data.get("bundle", {}).get("name", "unknown_bundle")
+        return bundle_name, merger.resources, self.main_data.get("targets", {}), self.main_data.get("variables", {})
+
+class Parameter:
+    """A notebook task base parameter."""
+    __slots__ = ("name", "value")
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+class Cluster:
+    """A job cluster (job_clusters entry) and the fields shown in diagrams."""
+    __slots__ = ("key", "spark_version", "node_type_id", "runtime_engine")
+
+    def __init__(self, key, spark_version, node_type_id, runtime_engine):
+        self.key = key
+        self.spark_version = spark_version
+        self.node_type_id = node_type_id
+        self.runtime_engine = runtime_engine
+
+class Task:
+    """A job task. task_type is "notebook", "python_wheel" or None for other task types."""
+    __slots__ = ("key", "task_type", "cluster_key", "parameters")
+
+    def __init__(self, key, task_type, cluster_key, parameters):
+        self.key = key
+        self.task_type = task_type
+        self.cluster_key = cluster_key
+        self.parameters = parameters
+
+class Edge:
+    """A directed edge between two nodes of a job, e.g. a depends_on between task keys."""
+    __slots__ = ("source", "target", "kind")
+
+    def __init__(self, source, target, kind):
+        self.source = source
+        self.target = target
+        self.kind = kind
+
+class Job:
+    """
+    A job with its tasks, task dependency edges and clusters.
+    trigger is an (interval, unit) tuple for periodic triggers, notifications
+    a list of (notification type, recipients) tuples, run_jobs the ids of
+    the jobs started by its run_job_task tasks and analysis the DagAnalysis
+    of its tasks.
+    """
+    __slots__ = ("id", "name", "trigger", "notifications", "tasks", "edges", "clusters", "run_jobs", "analysis")
+
+    def __init__(self, id, name, trigger, notifications, tasks, edges, clusters, run_jobs=(), analysis=None):
+        self.id = id
+        self.name = name
+        self.trigger = trigger
+        self.notifications = notifications
+        self.tasks = tasks
+        self.edges = edges
+        self.clusters = clusters
+        self.run_jobs = run_jobs
+        self.analysis = analysis
+
+class DagAnalysis:
+    """
+    The task graph of a job as analysed by analyze_dag(). order is a
+    topological order of the tasks that are not blocked by a cycle, cycles
+    lists the task keys of every dependency cycle and unresolved the
+    (task key, missing dependency) pairs. depth is the number of tasks on the
+    longest serial chain, chain that chain, and width the largest number of
+    tasks that run at the same step when every task starts as early as its
+    dependencies allow.
+    """
+    __slots__ = ("order", "cycles", "unresolved", "depth", "chain", "width")
+
+    def __init__(self, order, cycles, unresolved, depth, chain, width):
+        self.order = order
+        self.cycles = cycles
+        self.unresolved = unresolved
+        self.depth = depth
+        self.chain = chain
+        self.width = width
+
+def analyze_dag(tasks, edges):
+    """
+    Analyses the depends_on graph of a job's tasks in time linear in the
+    number of tasks and edges: a topological sort (Kahn's algorithm) that
+    also tracks the longest chain ending at every task, then Tarjan's
+    algorithm over the tasks the sort could not reach to find the cycles.
+    Returns a DagAnalysis.
+    """
+    keys = list(dict.fromkeys(task.key for task in tasks))
+    successors = {key: [] for key in keys}
+    indegree = dict.fromkeys(keys, 0)
+    unresolved = []
+    for edge in edges:
+        if edge.kind != "depends_on" or edge.target not in successors:
+            continue
+        if edge.source not in successors:
+            unresolved.append((edge.target, edge.source))
+            continue
+        successors[edge.source].append(edge.target)
+        indegree[edge.target] += 1
+
+    # level: number of tasks on the longest chain ending at a task, previous: its predecessor on that chain
+    ready = collections.deque(key for key in keys if indegree[key] == 0)
+    level = dict.fromkeys(ready, 1)
+    previous = {}
+    order = []
+    while ready:
+        key = ready.popleft()
+        order.append(key)
+        for successor in successors[key]:
+            if level[key] + 1 > level.get(successor, 0):
+                level[successor] = level[key] + 1
+                previous[successor] = key
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                ready.append(successor)
+
+    chain = []
+    width = 0
+    if order:
+        key = max(order, key=level.__getitem__)
+        while key is not None:
+            chain.append(key)
+            key = previous.get(key)
+        chain.reverse()
+        width = max(collections.Counter(level[key] for key in order).values())
+
+    cycles = []
+    if len(order) < len(keys):
+        blocked = [key for key in keys if indegree[key] > 0]
+        positions = {key: position for position, key in enumerate(blocked)}
+        for component in _strongly_connected(blocked, successors):
+            if len(component) > 1 or component[0] in successors[component[0]]:
+                cycles.append(sorted(component, key=positions.__getitem__))
+    return DagAnalysis(order, cycles, unresolved, len(chain), chain, width)
+
+def _strongly_connected(nodes, successors):
+    """
+    Returns the strongly connected components of the subgraph induced by
+    nodes (Tarjan's algorithm, iterative so deep graphs do not hit the
+    recursion limit).
+    """
+    node_set = set(nodes)
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors[root]))]
+        while work:
+            node, remaining = work[-1]
+            for successor in remaining:
+                if successor not in node_set:
                     continue
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(successors[successor])))
+                    break
+                if successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
 
-                resources = resource_yaml.get("resources", {})
-                for resource_type, items in resources.items():
-                    if resource_type not in all_resources:
-                        all_resources[resource_type] = {}
-                    for key, value in items.items():
-                        # For jobs, merge definitions if key already exists.
-                        if resource_type == "jobs" and key in all_resources[resource_type]:
-                            existing = all_resources[resource_type][key]
-                            # Merge tasks: extend list if tasks exist
-                            if "tasks" in value:
-                                if "tasks" not in existing:
-                                    existing["tasks"] = []
-                                existing["tasks"].extend(value["tasks"])
-                            # Merge job_clusters: add unique clusters by job_cluster_key
-                            if "job_clusters" in value:
-                                if "job_clusters" not in existing:
-                                    existing["job_clusters"] = []
-                                for new_cluster in value["job_clusters"]:
-                                    new_key = new_cluster.get("job_cluster_key")
-                                    duplicate = False
-                                    for existing_cluster in existing["job_clusters"]:
-                                        if existing_cluster.get("job_cluster_key") == new_key:
-                                            duplicate = True
-                                            break
-                                    if not duplicate:
-                                        existing["job_clusters"].append(new_cluster)
-                            # Optionally, merge other fields if needed.
-                        else:
-                            all_resources[resource_type][key] = value
-            except Exception as e:
-                print(f"[WARNING] Failed to load {resource_file}: {e}")
-    return bundle_name, all_resources, targets, variables
+def dag_notes(job, text):
+    """
+    Returns the DAG analysis of a job as short label lines for the job node
+    of the diagrams: depth, width and longest chain, cycles and unresolved
+    dependencies.
+    """
+    analysis = job.analysis
+    notes = []
+    if analysis is None:
+        return notes
+    if analysis.depth:
+        chain = text(analysis.chain[0])
+        if analysis.depth > 1:
+            chain += f" -> {text(analysis.chain[-1])}"
+        notes.append(f"DAG depth {analysis.depth}, width {analysis.width}, longest chain {chain}")
+    for cycle in analysis.cycles:
+        notes.append(f"Cycle: {', '.join(str(text(key)) for key in cycle)}")
+    for task_key, dependency in analysis.unresolved:
+        notes.append(f"Unresolved: {text(task_key)} depends on {text(dependency)}")
+    return notes
 
-def build_plantuml_for_target(bundle_name, resources, target_name, target_data):
+# ${resources.jobs.<job>.id}, as used by run_job_task to start another job of the bundle
+JOB_REFERENCE_PATTERN = re.compile(r"\$\{resources\.jobs\.([\w\-]+)\.id\}")
+
+def job_run_jobs(job_data):
+    """
+    Returns the ids of the bundle jobs that the run_job_task tasks of a job
+    definition start, in task order. Only looks at the job references, so it
+    is much cheaper than build_job().
+    """
+    run_jobs = []
+    for task in job_data.get("tasks") or []:
+        if not task.get("task_key"):
+            continue
+        run_job_match = JOB_REFERENCE_PATTERN.fullmatch(str((task.get("run_job_task") or {}).get("job_id", "")))
+        if run_job_match and run_job_match.group(1) not in run_jobs:
+            run_jobs.append(run_job_match.group(1))
+    return run_jobs
+
+def build_job(job_id, job_data):
+    """
+    Builds the Job node for one job definition. String fields are kept as
+    written in the YAML; references are resolved when the diagram is emitted.
+    """
+    trigger = None
+    trigger_def = job_data.get("trigger") or {}
+    if "periodic" in trigger_def:
+        periodic = trigger_def["periodic"] or {}
+        trigger = (periodic.get("interval", ""), periodic.get("unit", ""))
+
+    notifications = [
+        (notif_type, list(recipients or []))
+        for notif_type, recipients in (job_data.get("email_notifications") or {}).items()
+    ]
+
+    tasks = []
+    edges = []
+    for task in job_data.get("tasks") or []:
+        task_key = task.get("task_key")
+        if not task_key:
+            continue
+        if "notebook_task" in task:
+            task_type = "notebook"
+        elif "python_wheel_task" in task:
+            task_type = "python_wheel"
+        else:
+            task_type = None
+        base_parameters = (task.get("notebook_task") or {}).get("base_parameters") or {}
+        parameters = [Parameter(name, value) for name, value in base_parameters.items()]
+        tasks.append(Task(task_key, task_type, task.get("job_cluster_key"), parameters))
+        for dep_item in task.get("depends_on") or []:
+            dep_key = dep_item.get("task_key")
+            if dep_key:
+                edges.append(Edge(dep_key, task_key, "depends_on"))
+
+    clusters = []
+    for cluster in job_data.get("job_clusters") or []:
+        cluster_key = cluster.get("job_cluster_key")
+        if cluster_key:
+            new_cluster = cluster.get("new_cluster") or {}
+            clusters.append(Cluster(
+                cluster_key,
+                new_cluster.get("spark_version", ""),
+                new_cluster.get("node_type_id", ""),
+                new_cluster.get("runtime_engine", "")
+            ))
+
+    return Job(
+        job_id, job_data.get("name", job_id), trigger, notifications, tasks, edges, clusters,
+        job_run_jobs(job_data), analyze_dag(tasks, edges)
+    )
+
+def apply_overrides(base, override, field=None):
+    """
+    Returns base with override deep-merged on top, the way target overrides
+    work: mappings are merged, items of keyed lists (see KEYED_LISTS) are
+    matched by key and everything else is replaced. Neither input is modified
+    and untouched subtrees are shared.
+    """
+    if isinstance(base, dict) and isinstance(override, dict):
+        merged = dict(base)
+        for key, value in override.items():
+            merged[key] = apply_overrides(base[key], value, key) if key in base else value
+        return merged
+    if isinstance(base, list) and isinstance(override, list) and field in KEYED_LISTS:
+        key_field = KEYED_LISTS[field]
+        merged = list(base)
+        index = {
+            item.get(key_field): position
+            for position, item in enumerate(merged)
+            if isinstance(item, dict) and item.get(key_field) is not None
+        }
+        for item in override:
+            item_key = item.get(key_field) if isinstance(item, dict) else None
+            if item_key is not None and item_key in index:
+                merged[index[item_key]] = apply_overrides(merged[index[item_key]], item)
+            else:
+                merged.append(item)
+        return merged
+    return override
+
+class BundleGraph:
+    """
+    The diagram model of a bundle, built from the merged resources and shared
+    by all targets and output formats. Job nodes are built the first time a
+    target needs them and then cached, so jobs left out by --select-jobs
+    cost nothing.
+    """
+    __slots__ = ("bundle_name", "_raw_jobs", "_jobs")
+
+    def __init__(self, bundle_name, resources):
+        self.bundle_name = bundle_name
+        self._raw_jobs = resources.get("jobs") or {}
+        self._jobs = {}
+
+    @property
+    def job_ids(self):
+        """The ids of the bundle's jobs, in definition order."""
+        return self._raw_jobs.keys()
+
+    def job(self, job_id):
+        """Returns the Job node of a job, building it on first use."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            # Targets run on several threads; whichever build lands first is kept
+            job = self._jobs.setdefault(job_id, build_job(job_id, self._raw_jobs[job_id]))
+        return job
+
+    def for_target(self, target_name, target_data, interpolator=None, job_ids=None):
+        """
+        Returns the TargetGraph for one target. Only jobs overridden in the
+        target's 'resources' section are rebuilt; all other Job nodes are shared.
+        If job_ids is given (see select_jobs), only those jobs are built and
+        included.
+        """
+        raw_jobs = self._raw_jobs
+        overrides = ((target_data.get("resources") or {}).get("jobs")) or {}
+        if job_ids is not None:
+            raw_jobs = {job_id: self._raw_jobs[job_id] for job_id in job_ids if job_id in self._raw_jobs}
+            overrides = {job_id: overrides[job_id] for job_id in job_ids if job_id in overrides}
+        # Overridden jobs keep their position and are built from the merged definition below
+        jobs = {job_id: None if job_id in overrides else self.job(job_id) for job_id in raw_jobs}
+        if overrides:
+            raw_jobs = dict(raw_jobs)
+            for job_id, override in overrides.items():
+                raw_jobs[job_id] = apply_overrides(self._raw_jobs.get(job_id, {}), override)
+                jobs[job_id] = build_job(job_id, raw_jobs[job_id])
+        text = interpolator.resolve if interpolator is not None else _identity
+        return TargetGraph(self.bundle_name, target_name, target_data, jobs, raw_jobs, text)
+
+    def select_jobs(self, target_data, patterns, with_upstream=False):
+        """
+        Returns the ids of the jobs of a target (including jobs only defined in
+        its overrides) matching any of the glob patterns, in diagram order.
+        With with_upstream, the jobs the selected jobs depend on through
+        run_job_task are added, transitively. Only job ids and job references
+        are looked at, so this works on the unresolved target_data.
+        """
+        overrides = ((target_data.get("resources") or {}).get("jobs")) or {}
+        candidates = list(self._raw_jobs) + [job_id for job_id in overrides if job_id not in self._raw_jobs]
+        selected = {
+            job_id for job_id in candidates
+            if any(fnmatch.fnmatchcase(job_id, pattern) for pattern in patterns)
+        }
+        if with_upstream:
+            pending = list(selected)
+            while pending:
+                job_id = pending.pop()
+                job_data = self._raw_jobs.get(job_id, {})
+                if job_id in overrides:
+                    job_data = apply_overrides(job_data, overrides[job_id])
+                for run_job in job_run_jobs(job_data):
+                    if run_job not in selected and (run_job in self._raw_jobs or run_job in overrides):
+                        selected.add(run_job)
+                        pending.append(run_job)
+        return [job_id for job_id in candidates if job_id in selected]
+
+class TargetGraph:
+    """
+    A BundleGraph as seen from one target: the target's jobs and their job
+    definitions plus text(), which resolves ${...} references in the strings
+    the backends emit. Jobs in highlighted are emphasised in the diagrams.
+    """
+    __slots__ = ("bundle_name", "target_name", "target_data", "jobs", "raw_jobs", "text", "highlighted")
+
+    def __init__(self, bundle_name, target_name, target_data, jobs, raw_jobs, text=None, highlighted=frozenset()):
+        self.bundle_name = bundle_name
+        self.target_name = target_name
+        self.target_data = target_data
+        self.jobs = jobs
+        self.raw_jobs = raw_jobs
+        self.text = text or _identity
+        self.highlighted = highlighted
+
+    def subset(self, job_ids, highlighted=None):
+        """Returns a TargetGraph with only the given jobs."""
+        return TargetGraph(
+            self.bundle_name, self.target_name, self.target_data,
+            {job_id: self.jobs[job_id] for job_id in job_ids},
+            self.raw_jobs,
+            self.text,
+            self.highlighted if highlighted is None else highlighted
+        )
+
+    def neighbours(self, job_ids):
+        """
+        Returns the jobs directly connected to the given jobs through
+        run_job_task, in either direction.
+        """
+        job_ids = set(job_ids)
+        neighbours = set()
+        for job_id, job in self.jobs.items():
+            for run_job in job.run_jobs:
+                if job_id in job_ids and run_job in self.jobs:
+                    neighbours.add(run_job)
+                if run_job in job_ids:
+                    neighbours.add(job_id)
+        return neighbours - job_ids
+
+def job_fingerprints(graph):
+    """
+    Computes a stable fingerprint per job of a TargetGraph: a hash of the job
+    definition after target overrides and variable resolution. Returns a
+    {job id: fingerprint} dict.
+    """
+    fingerprints = {}
+    for job_id in graph.jobs:
+        resolved = graph.text(graph.raw_jobs.get(job_id, {}))
+        canonical = json.dumps(resolved, sort_keys=True, separators=(",", ":"), default=str)
+        fingerprints[job_id] = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return fingerprints
+
+def load_manifest(path):
+    """Loads a manifest written by a previous run. Returns its {target: {job id: fingerprint}} dict."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("targets", {})
+
+def changed_jobs(graph, fingerprints, previous_fingerprints):
     """
-    Builds a PlantUML diagram (as text) for a single environment/target.
+    Returns the ids of the jobs whose fingerprint differs from the previous
+    manifest (including new jobs), in graph order.
     """
-    target_mode = target_data.get("mode", "unknown")
-    workspace = target_data.get("workspace", {})
+    return [job_id for job_id in graph.jobs if previous_fingerprints.get(job_id) != fingerprints[job_id]]
+
+def _identity(value):
+    return value
+
+# Styling of highlighted (changed) jobs
+HIGHLIGHT_COLOR_PLANTUML = "#F5B041;line:D35400;line.bold"
+HIGHLIGHT_STYLE_MERMAID = "fill:#D35400,color:#FFFFFF,stroke:#F5B041,stroke-width:4px;"
+
+def emit_plantuml(graph):
+    """
+    Emits a PlantUML diagram (as text) for a single environment/target.
+    """
+    text = graph.text
+    target_name = graph.target_name
+    target_mode = graph.target_data.get("mode", "unknown")
+    workspace = graph.target_data.get("workspace", {})
     workspace_host = workspace.get("host", "unknown")
 
     # We'll create a diagram that focuses solely on this environment.
@@ -96,91 +955,73 @@ def build_plantuml_for_target(bundle_name, resources, target_name, target_data):
     # Label with environment details
     target_label = f'{target_name} (mode: {target_mode})\\n(host: {workspace_host})'
     # Top-level package for this environment
-    lines.append(f'package "{bundle_name} - {target_label}" {{')
+    lines.append(f'package "{graph.bundle_name} - {target_label}" {{')
 
     # If there are jobs, render them
-    if "jobs" in resources:
+    if graph.jobs:
         # A subpackage for all jobs in this environment
         lines.append(f'  package "Jobs" as Jobs_{target_name} {{')
         
         # For each job in the merged resources
-        for job_id, job_data in resources["jobs"].items():
+        for job_id, job in graph.jobs.items():
             # Build job label with triggers, notifications
-            job_name = job_data.get("name", job_id)
-
-            # Trigger info
             trigger_str = ""
-            trigger_def = job_data.get("trigger", {})
-            if "periodic" in trigger_def:
-                interval = trigger_def["periodic"].get("interval", "")
-                unit = trigger_def["periodic"].get("unit", "")
-                trigger_str = f'\\ntrigger: periodic ({interval} {unit})'
-
-            # Notifications
-            email_notifications = job_data.get("email_notifications", {})
+            if job.trigger is not None:
+                interval, unit = job.trigger
+                trigger_str = f'\\ntrigger: periodic ({text(interval)} {text(unit)})'
+
             notify_str = ""
-            for notif_type, recipients in email_notifications.items():
-                notify_str += f'\\nnotify {notif_type}: {", ".join(recipients)}'
+            for notif_type, recipients in job.notifications:
+                notify_str += f'\\nnotify {notif_type}: {", ".join(str(text(r)) for r in recipients)}'
 
-            job_label = f'{job_name}{trigger_str}{notify_str}'
+            dag_str = "".join(f"\\n{note}" for note in dag_notes(job, text))
+            job_label = f'{text(job.name)}{trigger_str}{notify_str}{dag_str}'
             job_alias = f'jobs_{job_id}_{target_name}'
-            lines.append(f'    rectangle "{job_label}" as {job_alias}')
+            highlight = f" {HIGHLIGHT_COLOR_PLANTUML}" if job_id in graph.highlighted else ""
+            lines.append(f'    rectangle "{job_label}" as {job_alias}{highlight}')
 
             # Workflow subpackage for tasks
             workflow_alias = f'Workflow_{job_id}_{target_name}'
             lines.append(f'    package "Workflow" as {workflow_alias} {{')
             lines.append(f'      {job_alias} --> {workflow_alias} : contains')
 
-            # Show tasks
-            tasks = job_data.get("tasks", [])
-            for task in tasks:
-                task_key = task.get("task_key")
-                if not task_key:
-                    continue
+            # Show tasks, with the dependencies of each task inside its package
+            edges_by_target = {}
+            for edge in job.edges:
+                edges_by_target.setdefault(edge.target, []).append(edge)
+            for task in job.tasks:
+                task_key = text(task.key)
                 task_alias = f'task_{job_id}_{task_key}_{target_name}'
-                if "notebook_task" in task:
+                if task.task_type == "notebook":
                     task_label = f'{task_key}\\n(notebook)'
-                elif "python_wheel_task" in task:
+                elif task.task_type == "python_wheel":
                     task_label = f'{task_key}\\n(python_wheel)'
                 else:
                     task_label = task_key
                 lines.append(f'      package "{task_label}" as {task_alias} {{')
-                depends_on = task.get("depends_on", [])
-                for dep_item in depends_on:
-                    dep_key = dep_item.get("task_key")
-                    if dep_key:
-                        dep_alias = f'task_{job_id}_{dep_key}_{target_name}'
-                        lines.append(f'      {dep_alias} --> {task_alias} : depends on')
+                for edge in edges_by_target.get(task.key, []):
+                    dep_alias = f'task_{job_id}_{text(edge.source)}_{target_name}'
+                    lines.append(f'      {dep_alias} --> {task_alias} : depends on')
                 
-                base_parameters = task.get("notebook_task", {}).get("base_parameters", {})
-                if base_parameters:
+                if task.parameters:
                     parameter_alias = f'parameters_{task_alias}'
-                    param_vals = ""
-                    for param, val in base_parameters.items():
-                        param_vals += f"{param}\\n"
-                    param_vals = param_vals.strip()
-                    
+                    param_vals = "".join(f"{text(p.name)}\\n" for p in task.parameters)
+                    param = text(task.parameters[-1].name)
                     lines.append(f'        rectangle "{param_vals}" as {param}_{parameter_alias}')
                 lines.append("      }") # end Task
 
             lines.append("    }")  # end Workflow
 
             # Clusters for this job
-            job_clusters = job_data.get("job_clusters", [])
-            for cluster in job_clusters:
-                cluster_key = cluster.get("job_cluster_key")
-                if cluster_key:
-                    new_cluster = cluster.get("new_cluster", {})
-                    spark_version = new_cluster.get("spark_version", "")
-                    node_type_id = new_cluster.get("node_type_id", "")
-                    runtime_engine = new_cluster.get("runtime_engine", "")
-                    cluster_label = (
-                        f'Cluster: {cluster_key}\\n'
-                        f'{spark_version}, {node_type_id}, {runtime_engine}'
-                    )
-                    cluster_alias = f'job_cluster_{job_id}_{cluster_key}_{target_name}'
-                    lines.append(f'    rectangle "{cluster_label}" as {cluster_alias}')
-                    lines.append(f'    {job_alias} --> {cluster_alias} : uses')
+            for cluster in job.clusters:
+                cluster_key = text(cluster.key)
+                cluster_label = (
+                    f'Cluster: {cluster_key}\\n'
+                    f'{text(cluster.spark_version)}, {text(cluster.node_type_id)}, {text(cluster.runtime_engine)}'
+                )
+                cluster_alias = f'job_cluster_{job_id}_{cluster_key}_{target_name}'
+                lines.append(f'    rectangle "{cluster_label}" as {cluster_alias}')
+                lines.append(f'    {job_alias} --> {cluster_alias} : uses')
 
         lines.append("  }")  # end Jobs_{target_name}
 
@@ -188,6 +1029,13 @@ def build_plantuml_for_target(bundle_name, resources, target_name, target_data):
     lines.append("@enduml")
     return "\n".join(lines)
 
+def build_plantuml_for_target(bundle_name, resources, target_name, target_data):
+    """
+    Builds a PlantUML diagram (as text) for a single environment/target
+    from already resolved resources.
+    """
+    return emit_plantuml(BundleGraph(bundle_name, resources).for_target(target_name, target_data))
+
 def sanitize_label(label):
     """
     Sanitize label for Mermaid diagram by escaping special characters
@@ -201,18 +1049,20 @@ def sanitize_label(label):
     
     return label
 
-def build_mermaid_for_target(bundle_name, resources, target_name, target_data):
+def emit_mermaid(graph):
     """
-    Builds an improved Mermaid diagram with enhanced readability and styling
+    Emits an improved Mermaid diagram with enhanced readability and styling
     """
-    target_mode = target_data.get("mode", "unknown")
-    workspace = target_data.get("workspace", {})
+    text = graph.text
+    target_name = graph.target_name
+    target_mode = graph.target_data.get("mode", "unknown")
+    workspace = graph.target_data.get("workspace", {})
     workspace_host = workspace.get("host", "unknown")
 
     # Start the Mermaid diagram with improved styling
     lines = []
     lines.append("---")
-    lines.append(f"title {sanitize_label(f'{bundle_name} ({target_name} mode {target_mode})')}")
+    lines.append(f"title {sanitize_label(f'{graph.bundle_name} ({target_name} mode {target_mode})')}")
     lines.append(f"host {workspace_host}")
     lines.append("---")
     lines.append("flowchart LR")
@@ -224,6 +1074,8 @@ def build_mermaid_for_target(bundle_name, resources, target_name, target_data):
     lines.append("    classDef taskNode fill:#5D6D7E,color:#FFFFFF,stroke:#2874A6,stroke-width:1px;")
     lines.append("    classDef clusterNode fill:#7F8C8D,color:#FFFFFF,stroke:#566573,stroke-width:1px;")
     lines.append("    classDef paramNode fill:#566573,color:#E5E7E9,stroke:#2C3E50,stroke-dasharray:5;")
+    if graph.highlighted:
+        lines.append(f"    classDef changedNode {HIGHLIGHT_STYLE_MERMAID}")
     lines.append("")
     
     # Create the main container for the environment
@@ -235,176 +1087,1447 @@ def build_mermaid_for_target(bundle_name, resources, target_name, target_data):
     lines.append("    subgraph Jobs")
     lines.append("    direction TB")
     
-    if "jobs" in resources:
-        for job_id, job_data in resources["jobs"].items():
-            job_name = job_data.get("name", job_id)
-            job_id_safe = job_id.replace("-", "_")
+    for job_id, job in graph.jobs.items():
+        job_id_safe = job_id.replace("-", "_")
 
-            # Trigger and notification information
-            trigger_str = ""
-            trigger_def = job_data.get("trigger", {})
-            if "periodic" in trigger_def:
-                interval = trigger_def["periodic"].get("interval", "")
-                unit = trigger_def["periodic"].get("unit", "")
-                trigger_str = f"Trigger: {interval} {unit}"
-
-            # Notifications
-            email_notifications = job_data.get("email_notifications", {})
-            notify_str = ""
-            for notif_type, recipients in email_notifications.items():
-                notify_str += f" Notify {notif_type}: {', '.join(recipients)}"
-
-            # Job node with comprehensive label
-            job_label = sanitize_label(f"{job_name} {trigger_str}{notify_str}")
-            lines.append(f'    {job_id_safe}("{job_label}"):::jobNode')
-
-            # Workflow subgraph
-            lines.append(f"    subgraph Workflow_{job_id_safe}[Workflow]")
-            lines.append("    direction TB")
-
-            # Tasks
-            tasks = job_data.get("tasks", [])
-            task_nodes = []
-            for task in tasks:
-                task_key = task.get("task_key")
-                if not task_key:
-                    continue
-                task_key_safe = task_key.replace("-", "_")
+        # Trigger and notification information
+        trigger_str = ""
+        if job.trigger is not None:
+            interval, unit = job.trigger
+            trigger_str = f"Trigger: {text(interval)} {text(unit)}"
 
-                # Determine task type with more descriptive labeling
-                if "notebook_task" in task:
-                    task_label = sanitize_label(f"{task_key} (Notebook Task)")
-                elif "python_wheel_task" in task:
-                    task_label = sanitize_label(f"{task_key} (Python Wheel Task)")
-                else:
-                    task_label = sanitize_label(f"{task_key} (Generic Task)")
-
-                # Task node
-                task_nodes.append(task_key_safe)
-                lines.append(f'    {task_key_safe}("{task_label}"):::taskNode')
-
-                # Base parameters with improved visualization
-                base_parameters = task.get("notebook_task", {}).get("base_parameters", {})
-                if base_parameters:
-                    param_str = sanitize_label("Parameters: " + ", ".join(base_parameters.keys()))
-                    lines.append(f'    {task_key_safe}_params("{param_str}"):::paramNode')
-                    lines.append(f'    {task_key_safe} --> {task_key_safe}_params')
-
-            # Task dependencies with clearer connections
-            for task in tasks:
-                task_key = task.get("task_key")
-                if not task_key:
-                    continue
-                task_key_safe = task_key.replace("-", "_")
-                
-                depends_on = task.get("depends_on", [])
-                for dep_item in depends_on:
-                    dep_key = dep_item.get("task_key")
-                    if dep_key:
-                        dep_key_safe = dep_key.replace("-", "_")
-                        lines.append(f'    {dep_key_safe} --> {task_key_safe}')
-
-            lines.append("    end")  # End Workflow subgraph
-
-            # Job Clusters with enhanced visualization
-            job_clusters = job_data.get("job_clusters", [])
-            for cluster in job_clusters:
-                cluster_key = cluster.get("job_cluster_key")
-                if cluster_key:
-                    new_cluster = cluster.get("new_cluster", {})
-                    spark_version = new_cluster.get("spark_version", "")
-                    node_type_id = new_cluster.get("node_type_id", "")
-                    runtime_engine = new_cluster.get("runtime_engine", "")
-                    
-                    cluster_label = sanitize_label(
-                        f"Cluster: {cluster_key} "
-                        f"Spark: {spark_version} "
-                        f"Nodes: {node_type_id} "
-                        f"Runtime: {runtime_engine}"
-                    )
-                    cluster_id_safe = f"cluster_{job_id_safe}"
-                    lines.append(f'    {cluster_id_safe}("{cluster_label}"):::clusterNode')
-                    lines.append(f'    {job_id_safe} --> {cluster_id_safe}')
+        notify_str = ""
+        for notif_type, recipients in job.notifications:
+            notify_str += f" Notify {notif_type}: {', '.join(str(text(r)) for r in recipients)}"
+
+        dag_str = "".join(f" {note}" for note in dag_notes(job, text))
+
+        # Job node with comprehensive label
+        job_label = sanitize_label(f"{text(job.name)} {trigger_str}{notify_str}{dag_str}")
+        lines.append(f'    {job_id_safe}("{job_label}"):::jobNode')
+        if job_id in graph.highlighted:
+            lines.append(f'    class {job_id_safe} changedNode')
+
+        # Workflow subgraph
+        lines.append(f"    subgraph Workflow_{job_id_safe}[Workflow]")
+        lines.append("    direction TB")
+
+        # Tasks
+        for task in job.tasks:
+            task_key = text(task.key)
+            task_key_safe = task_key.replace("-", "_")
+
+            # Determine task type with more descriptive labeling
+            if task.task_type == "notebook":
+                task_label = sanitize_label(f"{task_key} (Notebook Task)")
+            elif task.task_type == "python_wheel":
+                task_label = sanitize_label(f"{task_key} (Python Wheel Task)")
+            else:
+                task_label = sanitize_label(f"{task_key} (Generic Task)")
+
+            # Task node
+            lines.append(f'    {task_key_safe}("{task_label}"):::taskNode')
+
+            # Base parameters with improved visualization
+            if task.parameters:
+                param_str = sanitize_label("Parameters: " + ", ".join(str(text(p.name)) for p in task.parameters))
+                lines.append(f'    {task_key_safe}_params("{param_str}"):::paramNode')
+                lines.append(f'    {task_key_safe} --> {task_key_safe}_params')
+
+        # Task dependencies with clearer connections
+        for edge in job.edges:
+            dep_key_safe = text(edge.source).replace("-", "_")
+            task_key_safe = text(edge.target).replace("-", "_")
+            lines.append(f'    {dep_key_safe} --> {task_key_safe}')
+
+        lines.append("    end")  # End Workflow subgraph
 
-            # Connect job to workflow
-            lines.append(f'    {job_id_safe} --> Workflow_{job_id_safe}')
+        # Job Clusters with enhanced visualization
+        for cluster in job.clusters:
+            cluster_label = sanitize_label(
+                f"Cluster: {text(cluster.key)} "
+                f"Spark: {text(cluster.spark_version)} "
+                f"Nodes: {text(cluster.node_type_id)} "
+                f"Runtime: {text(cluster.runtime_engine)}"
+            )
+            cluster_id_safe = f"cluster_{job_id_safe}"
+            lines.append(f'    {cluster_id_safe}("{cluster_label}"):::clusterNode')
+            lines.append(f'    {job_id_safe} --> {cluster_id_safe}')
 
-        lines.append("    end")  # End Jobs subgraph
+        # Connect job to workflow
+        lines.append(f'    {job_id_safe} --> Workflow_{job_id_safe}')
+
+    lines.append("    end")  # End Jobs subgraph
     
     lines.append("    end")  # End target environment subgraph
     
     return "\n".join(lines)
 
-def run_plantuml(puml_content, output_file):
+def build_mermaid_for_target(bundle_name, resources, target_name, target_data):
+    """
+    Builds an improved Mermaid diagram with enhanced readability and styling
+    from already resolved resources.
+    """
+    return emit_mermaid(BundleGraph(bundle_name, resources).for_target(target_name, target_data))
+
+def job_node_count(job):
+    """Number of diagram nodes a job expands to: the job, its tasks, parameter boxes and clusters."""
+    return 1 + len(job.tasks) + sum(1 for task in job.tasks if task.parameters) + len(job.clusters)
+
+def split_jobs(graph, max_nodes):
+    """
+    Groups the jobs of a TargetGraph, in order, into parts of at most max_nodes
+    diagram nodes. A job that is larger than max_nodes on its own gets a part
+    of its own. Returns a list of job id lists.
+    """
+    parts = []
+    current = []
+    current_size = 0
+    for job_id, job in graph.jobs.items():
+        size = job_node_count(job)
+        if current and current_size + size > max_nodes:
+            parts.append(current)
+            current = []
+            current_size = 0
+        current.append(job_id)
+        current_size += size
+    if current:
+        parts.append(current)
+    return parts
+
+def shared_clusters(graph):
+    """
+    Groups the job clusters of a TargetGraph by their spec (Spark version, node
+    type and runtime engine). Returns a list of (spec, job ids) tuples in order
+    of first use.
+    """
+    text = graph.text
+    clusters = {}
+    for job_id, job in graph.jobs.items():
+        for cluster in job.clusters:
+            spec = (text(cluster.spark_version), text(cluster.node_type_id), text(cluster.runtime_engine))
+            job_ids = clusters.setdefault(spec, [])
+            if job_id not in job_ids:
+                job_ids.append(job_id)
+    return list(clusters.items())
+
+def emit_plantuml_overview(graph, parts, links):
+    """
+    Emits a PlantUML overview of a split target: one package per part with its
+    jobs, each linked to the part's diagram, and the clusters shared between jobs.
+    """
+    text = graph.text
+    target_name = graph.target_name
+    target_mode = graph.target_data.get("mode", "unknown")
+    workspace_host = graph.target_data.get("workspace", {}).get("host", "unknown")
+
+    lines = []
+    lines.append("@startuml")
+    lines.append("!theme plain")
+    target_label = f'{target_name} (mode: {target_mode})\\n(host: {workspace_host})'
+    lines.append(f'package "{graph.bundle_name} - {target_label} - overview" {{')
+    for number, (job_ids, link) in enumerate(zip(parts, links), start=1):
+        lines.append(f'  package "Part {number} ({len(job_ids)} jobs)" as Part_{number}_{target_name} {{')
+        for job_id in job_ids:
+            lines.append(f'    rectangle "{text(graph.jobs[job_id].name)}" as jobs_{job_id}_{target_name} [[{link}]]')
+        lines.append("  }")
+    for number, ((spark_version, node_type_id, runtime_engine), job_ids) in enumerate(shared_clusters(graph), start=1):
+        cluster_alias = f'cluster_spec_{number}_{target_name}'
+        lines.append(f'  rectangle "Cluster\\n{spark_version}, {node_type_id}, {runtime_engine}" as {cluster_alias}')
+        for job_id in job_ids:
+            lines.append(f'  jobs_{job_id}_{target_name} --> {cluster_alias} : uses')
+    lines.append("}")
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+def emit_mermaid_overview(graph, parts, links):
+    """
+    Emits a Mermaid overview of a split target: one subgraph per part with its
+    jobs, each linked to the part's diagram, and the clusters shared between jobs.
+    """
+    text = graph.text
+    target_name = graph.target_name
+    target_mode = graph.target_data.get("mode", "unknown")
+    workspace_host = graph.target_data.get("workspace", {}).get("host", "unknown")
+
+    lines = []
+    lines.append("---")
+    lines.append(f"title {sanitize_label(f'{graph.bundle_name} ({target_name} mode {target_mode}) overview')}")
+    lines.append(f"host {workspace_host}")
+    lines.append("---")
+    lines.append("flowchart LR")
+    lines.append("    classDef jobNode fill:#2C3E50,color:#FFFFFF,stroke:#1A5276,stroke-width:2px;")
+    lines.append("    classDef clusterNode fill:#7F8C8D,color:#FFFFFF,stroke:#566573,stroke-width:1px;")
+    lines.append("")
+    lines.append(f"    subgraph {target_name}[\" {target_name} Environment \"]")
+    lines.append("    direction TB")
+    for number, (job_ids, link) in enumerate(zip(parts, links), start=1):
+        lines.append(f'    subgraph Part_{number}["Part {number} ({len(job_ids)} jobs)"]')
+        lines.append("    direction TB")
+        for job_id in job_ids:
+            job_id_safe = job_id.replace("-", "_")
+            lines.append(f'    {job_id_safe}("{sanitize_label(str(text(graph.jobs[job_id].name)))}"):::jobNode')
+            lines.append(f'    click {job_id_safe} "{link}" "Open part {number}"')
+        lines.append("    end")
+    for number, ((spark_version, node_type_id, runtime_engine), job_ids) in enumerate(shared_clusters(graph), start=1):
+        cluster_id = f"cluster_spec_{number}"
+        cluster_label = sanitize_label(f"Cluster Spark: {spark_version} Nodes: {node_type_id} Runtime: {runtime_engine}")
+        lines.append(f'    {cluster_id}("{cluster_label}"):::clusterNode')
+        for job_id in job_ids:
+            lines.append(f'    {job_id.replace("-", "_")} --> {cluster_id}')
+    lines.append("    end")
+    return "\n".join(lines)
+
+def svg_title(graph, suffix=""):
+    target_mode = graph.target_data.get("mode", "unknown")
+    workspace_host = graph.target_data.get("workspace", {}).get("host", "unknown")
+    return f"{graph.bundle_name} ({graph.target_name} mode {target_mode}{suffix}) - {workspace_host}"
+
+def emit_svg(graph):
+    """
+    Emits an SVG diagram of the job -> task -> cluster graph (the same nodes as
+    the Mermaid diagram) laid out with the built-in layered layout, one block
+    per job.
+    """
+    text = graph.text
+    components = []
+    for job_id, job in graph.jobs.items():
+        nodes = []
+        edges = []
+        trigger_str = ""
+        if job.trigger is not None:
+            interval, unit = job.trigger
+            trigger_str = f" Trigger: {text(interval)} {text(unit)}"
+        notify_str = "".join(
+            f" Notify {notif_type}: {', '.join(str(text(r)) for r in recipients)}"
+            for notif_type, recipients in job.notifications
+        )
+        job_node = ("job", job_id)
+        style = "changed" if job_id in graph.highlighted else "job"
+        dag_str = "".join(f" {note}" for note in dag_notes(job, text))
+        nodes.append(LayoutNode(job_node, f"{text(job.name)}{trigger_str}{notify_str}{dag_str}", style))
+
+        cluster_nodes = {}
+        for cluster in job.clusters:
+            cluster_node = ("cluster", cluster.key)
+            cluster_nodes[cluster.key] = cluster_node
+            nodes.append(LayoutNode(
+                cluster_node,
+                f"Cluster: {text(cluster.key)} Spark: {text(cluster.spark_version)} "
+                f"Nodes: {text(cluster.node_type_id)} Runtime: {text(cluster.runtime_engine)}",
+                "cluster"
+            ))
+
+        task_keys = {task.key for task in job.tasks}
+        dependent_tasks = {edge.target for edge in job.edges if edge.source in task_keys}
+        for task in job.tasks:
+            task_node = ("task", task.key)
+            if task.task_type == "notebook":
+                label = f"{text(task.key)} (Notebook Task)"
+            elif task.task_type == "python_wheel":
+                label = f"{text(task.key)} (Python Wheel Task)"
+            else:
+                label = f"{text(task.key)} (Generic Task)"
+            nodes.append(LayoutNode(task_node, label, "task"))
+            if task.key not in dependent_tasks:
+                edges.append((job_node, task_node))
+            if task.parameters:
+                param_node = ("params", task.key)
+                nodes.append(LayoutNode(param_node, "Parameters: " + ", ".join(str(text(p.name)) for p in task.parameters), "param"))
+                edges.append((task_node, param_node))
+            if task.cluster_key in cluster_nodes:
+                edges.append((task_node, cluster_nodes[task.cluster_key]))
+        for edge in job.edges:
+            if edge.source in task_keys and edge.target in task_keys:
+                edges.append((("task", edge.source), ("task", edge.target)))
+        used_clusters = {cluster_nodes[task.cluster_key] for task in job.tasks if task.cluster_key in cluster_nodes}
+        for cluster_node in cluster_nodes.values():
+            if cluster_node not in used_clusters:
+                edges.append((job_node, cluster_node))
+        components.append((nodes, edges))
+    return emit_svg_components(svg_title(graph), components)
+
+def emit_svg_overview(graph, parts, links):
+    """
+    Emits an SVG overview of a split target: the jobs of each part, linked to
+    the part's diagram, and the clusters shared between jobs.
+    """
+    text = graph.text
+    nodes = []
+    edges = []
+    for job_ids, link in zip(parts, links):
+        for job_id in job_ids:
+            style = "changed" if job_id in graph.highlighted else "job"
+            nodes.append(LayoutNode(("job", job_id), str(text(graph.jobs[job_id].name)), style, link))
+    for number, ((spark_version, node_type_id, runtime_engine), job_ids) in enumerate(shared_clusters(graph), start=1):
+        cluster_node = ("cluster", number)
+        nodes.append(LayoutNode(cluster_node, f"Cluster Spark: {spark_version} Nodes: {node_type_id} Runtime: {runtime_engine}", "cluster"))
+        edges.extend((("job", job_id), cluster_node) for job_id in job_ids)
+    return emit_svg_components(svg_title(graph, " overview"), [(nodes, edges)])
+
+# Mermaid build loaded by the HTML viewer the first time a job is expanded
+MERMAID_CDN_URL = "https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.min.js"
+# Jobs listed at once by the HTML viewer; more are added on demand
+HTML_PAGE_SIZE = 200
+# Page of the HTML viewer, with __PLACEHOLDERS__ filled in by emit_html(). The
+# index and the job fragments are JavaScript files that hand their JSON to
+# dabsViewer, so the page also works when opened from disk, where fetch() is blocked.
+HTML_VIEWER_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "htmlViewer.html")
+
+def emit_html(graph, output, name):
+    """
+    Builds the HTML viewer of a target: a small page, <output>_<name>.html,
+    with client-side search over a compact job index, and one Mermaid
+    fragment per job under <output>/html/<name>/jobs/ that the page only
+    loads and renders when the job is expanded. Returns (None, file, content)
+    tuples like build_diagrams(), the page first.
+    """
+    text = graph.text
+    data_dir = f"{output}/html/{name}"
+    files = []
+    jobs = []
+    for number, (job_id, job) in enumerate(graph.jobs.items()):
+        trigger = ""
+        if job.trigger is not None:
+            interval, unit = job.trigger
+            trigger = f"{text(interval)} {text(unit)}"
+        analysis = job.analysis
+        jobs.append({
+            "id": job_id,
+            "name": str(text(job.name)),
+            "tasks": len(job.tasks),
+            "depth": analysis.depth,
+            "width": analysis.width,
+            "issues": len(analysis.cycles) + len(analysis.unresolved),
+            "trigger": trigger,
+            "clusters": sorted({str(text(cluster.node_type_id)) for cluster in job.clusters if cluster.node_type_id}),
+        })
+        fragment = emit_mermaid(graph.subset([job_id]))
+        files.append((None, f"{data_dir}/jobs/{number}.js", f"dabsViewer.fragment({number},{json.dumps(fragment)});\n"))
+
+    index = {"bundle": graph.bundle_name, "target": graph.target_name, "jobs": jobs}
+    with open(HTML_VIEWER_TEMPLATE, encoding="utf-8") as f:
+        template = f.read()
+    page = (
+        template
+        .replace("__TITLE__", html.escape(svg_title(graph)))
+        .replace("__DATA_DIR__", f"{os.path.basename(output)}/html/{name}")
+        .replace("__MERMAID_URL__", MERMAID_CDN_URL)
+        .replace("__MERMAID_THEME__", THEMES["mermaid"])
+        .replace("__PAGE_SIZE__", str(HTML_PAGE_SIZE))
+    )
+    return [
+        (None, f"{output}_{name}.html", page),
+        (None, f"{data_dir}/index.js", f"dabsViewer.index({json.dumps(index, separators=(',', ':'))});\n"),
+    ] + files
+
+def build_diagrams(target_graph, diagram_type, output, max_nodes=None, name=None):
+    """
+    Builds the diagram sources for one target, named after the target unless
+    a name is given. Returns a list of
+    (source_file, image_file, diagram_content) tuples: a single diagram, or, if
+    the target has more than max_nodes nodes, an overview followed by one
+    diagram per part. SVG diagrams are written directly, so their source_file
+    is None. PlantUML and Mermaid overviews are rendered as SVG, since links
+    to the parts cannot be followed in a PNG. The HTML viewer (see emit_html)
+    loads jobs one at a time and is never split.
+    """
+    target_name = name or target_graph.target_name
+    if diagram_type == "html":
+        return emit_html(target_graph, output, target_name)
+    image_ext = "png"
+    if diagram_type == "plantuml":
+        emit, emit_overview, file_ext = emit_plantuml, emit_plantuml_overview, "puml"
+    elif diagram_type == "svg":
+        emit, emit_overview, file_ext = emit_svg, emit_svg_overview, None
+        image_ext = "svg"
+    else:
+        emit, emit_overview, file_ext = emit_mermaid, emit_mermaid_overview, "mmd"
+
+    def files(suffix="", image_ext=image_ext):
+        source_file = f"{output}/source/{target_name}{suffix}.{file_ext}" if file_ext else None
+        return source_file, f"{output}_{target_name}{suffix}.{image_ext}"
+
+    total_nodes = sum(job_node_count(job) for job in target_graph.jobs.values())
+    if max_nodes is None or total_nodes <= max_nodes:
+        return [files() + (emit(target_graph),)]
+
+    parts = split_jobs(target_graph, max_nodes)
+    part_files = [files(f"_part{number}") for number in range(1, len(parts) + 1)]
+    links = [os.path.basename(part_image) for _, part_image in part_files]
+    diagrams = [files(image_ext="svg") + (emit_overview(target_graph, parts, links),)]
+    for job_ids, (part_source, part_image) in zip(parts, part_files):
+        diagrams.append((part_source, part_image, emit(target_graph.subset(job_ids))))
+    return diagrams
+
+def image_format(image_file):
+    """Image format of an output file, from its extension ("png" or "svg")."""
+    return os.path.splitext(image_file)[1][1:].lower()
+
+def run_plantuml(puml_content, output_file, log=print):
     """
     Writes the PlantUML source to a temporary file and calls the PlantUML CLI
-    to render it as a PNG. Captures stdout/stderr for debugging.
+    to render it as a PNG (or SVG, after the output file's extension).
+    Captures stdout/stderr for debugging. Returns True if the image was generated.
     """
+    fmt = image_format(output_file)
     with tempfile.NamedTemporaryFile(delete=False, suffix=".puml") as tmp:
         tmp_name = tmp.name
         tmp.write(puml_content.encode("utf-8"))
     
     try:
         result = subprocess.run(
-            ["plantuml", "-tpng", tmp_name],
+            ["plantuml", f"-t{fmt}", tmp_name],
             capture_output=True,
             text=True
         )
         if result.returncode != 0:
-            print("[ERROR] PlantUML execution failed:")
-            print("stdout:", result.stdout)
-            print("stderr:", result.stderr)
-            return
+            log("[ERROR] PlantUML execution failed:")
+            log(f"stdout: {result.stdout}")
+            log(f"stderr: {result.stderr}")
+            return False
 
-        generated_png = tmp_name.replace(".puml", ".png")
-        if os.path.exists(generated_png):
-            shutil.move(generated_png, os.path.abspath(output_file))
-            print(f"[INFO] PNG generated at: {os.path.abspath(output_file)}")
-        else:
-            print(f"[ERROR] Expected PNG not found at: {generated_png}")
-            print("PlantUML output:")
-            print("stdout:", result.stdout)
-            print("stderr:", result.stderr)
+        generated_image = tmp_name.replace(".puml", f".{fmt}")
+        if os.path.exists(generated_image):
+            shutil.move(generated_image, os.path.abspath(output_file))
+            log(f"[INFO] {fmt.upper()} generated at: {os.path.abspath(output_file)}")
+            return True
+        log(f"[ERROR] Expected {fmt.upper()} not found at: {generated_image}")
+        log("PlantUML output:")
+        log(f"stdout: {result.stdout}")
+        log(f"stderr: {result.stderr}")
+        return False
     except Exception as e:
-        print(f"[ERROR] Exception during PlantUML execution: {e}")
+        log(f"[ERROR] Exception during PlantUML execution: {e}")
+        return False
     finally:
         if os.path.exists(tmp_name):
             os.remove(tmp_name)
 
-def run_mermaid(mermaid_content, output_file):
+def run_mermaid(mermaid_content, output_file, log=print):
     """
-    Uses the Mermaid CLI to convert Mermaid source to PNG.
+    Uses the Mermaid CLI to convert Mermaid source to PNG (or SVG; mmdc picks
+    the format from the output file's extension).
     Requires mermaid-cli to be installed.
+    Returns True if the image was generated.
     """
     with tempfile.NamedTemporaryFile(delete=False, suffix=".mmd") as tmp:
         tmp_name = tmp.name
         tmp.write(mermaid_content.encode("utf-8"))
-        print(tmp_name)
-        print(os.path.abspath(output_file))
     
-#     try:
-    if True:
+    try:
         result = subprocess.run(
-            ["mmdc", "-i", tmp_name, "-o", os.path.abspath(output_file), "-t", "dark"],
+            ["mmdc", "-i", tmp_name, "-o", os.path.abspath(output_file), "-t", THEMES["mermaid"]],
             capture_output=True,
             text=True
         )
-        if result .returncode != 0:
-            print("[ERROR] Mermaid CLI execution failed:")
-            print("stdout:", result.stdout)
-            print("stderr:", result.stderr)
+        if result.returncode != 0:
+            log("[ERROR] Mermaid CLI execution failed:")
+            log(f"stdout: {result.stdout}")
+            log(f"stderr: {result.stderr}")
+            return False
+
+        log(f"[INFO] {image_format(output_file).upper()} generated at: {os.path.abspath(output_file)}")
+        return True
+    except Exception as e:
+        log(f"[ERROR] Exception during Mermaid CLI execution: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+# Marker PlantUML writes after every image in pipe mode (-pipedelimitor)
+PIPE_DELIMITER = "___DABS_VISUALIZER_END_OF_IMAGE___"
+# Seconds a persistent renderer may spend on one diagram before it is killed
+RENDER_TIMEOUT_SECONDS = 120
+# Themes passed to the renderers; part of the render cache key
+THEMES = {"plantuml": "plain", "mermaid": "dark"}
+MERMAID_RENDERER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mermaidRenderer.mjs")
+
+class RendererError(Exception):
+    """Raised when a persistent renderer fails to produce an image."""
+
+class DiagramError(RendererError):
+    """Raised when the renderer rejects a diagram but is still usable."""
+
+class PersistentRenderer(abc.ABC):
+    """
+    A long-running renderer process that receives diagram source on stdin
+    and writes image bytes to stdout. The process is started on the first
+    render and restarted if it dies or times out, so the startup cost (JVM,
+    headless browser) is paid once per run instead of once per diagram.
+    stdout and stderr are multiplexed with select(), which needs a POSIX system.
+    """
+    def __init__(self, command, timeout=RENDER_TIMEOUT_SECONDS):
+        self.command = command
+        self.timeout = timeout
+        self.process = None
+        self._buffer = b""
+        self._stderr = collections.deque(maxlen=50)
+        self._stderr_partial = b""
+        self._stderr_open = False
+        # stderr lines written since the current request was sent
+        self._request_stderr = []
+        self._deadline = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0
+        )
+        self._buffer = b""
+        self._stderr_partial = b""
+        self._stderr_open = True
+
+    def stderr_tail(self):
+        return "\n".join(self._stderr)
+
+    def render(self, source):
+        """Renders the diagram source and returns the image bytes."""
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        # Anything still pending on stderr belongs to an earlier request
+        self._poll_stderr()
+        self._request_stderr = []
+        self._deadline = time.monotonic() + self.timeout
+        try:
+            self._send(source.encode("utf-8"))
+            return self._receive()
+        except DiagramError:
+            raise
+        except (OSError, RendererError) as e:
+            # The process is in an unknown state; the next render starts a fresh one
+            self.close(kill=True)
+            raise RendererError(f"{e}\n{self.stderr_tail()}".strip()) from e
+
+    @abc.abstractmethod
+    def _send(self, payload):
+        """Writes one encoded diagram to the process's stdin."""
+
+    @abc.abstractmethod
+    def _receive(self):
+        """Reads the answer to the last request and returns the image bytes."""
+
+    def _add_stderr(self, chunk):
+        self._stderr_partial += chunk
+        *lines, self._stderr_partial = self._stderr_partial.split(b"\n")
+        for line in lines:
+            text = line.decode("utf-8", errors="replace").rstrip()
+            self._stderr.append(text)
+            self._request_stderr.append(text)
+
+    def _read_stderr(self):
+        chunk = os.read(self.process.stderr.fileno(), 65536)
+        if chunk:
+            self._add_stderr(chunk)
+        else:
+            self._stderr_open = False
+
+    def _poll_stderr(self):
+        """Reads whatever the renderer has written to stderr without waiting."""
+        while self._stderr_open and select.select([self.process.stderr], [], [], 0)[0]:
+            self._read_stderr()
+
+    def _fill(self):
+        stdout = self.process.stdout
+        while True:
+            remaining = self._deadline - time.monotonic()
+            if remaining <= 0:
+                raise RendererError(f"Renderer did not answer within {self.timeout:g}s (command: {' '.join(self.command)})")
+            streams = [stdout, self.process.stderr] if self._stderr_open else [stdout]
+            readable, _, _ = select.select(streams, [], [], remaining)
+            if self.process.stderr in readable:
+                # Drained alongside stdout so a chatty renderer never blocks on a full pipe
+                self._read_stderr()
+            if stdout in readable:
+                chunk = os.read(stdout.fileno(), 65536)
+                if not chunk:
+                    raise RendererError(f"Renderer exited unexpectedly (command: {' '.join(self.command)})")
+                self._buffer += chunk
+                return
+
+    def _read_until(self, marker):
+        start = 0
+        while True:
+            index = self._buffer.find(marker, start)
+            if index != -1:
+                data = self._buffer[:index]
+                self._buffer = self._buffer[index + len(marker):]
+                return data
+            start = max(0, len(self._buffer) - len(marker) + 1)
+            self._fill()
+
+    def _read_exact(self, size):
+        while len(self._buffer) < size:
+            self._fill()
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return data
+
+    def close(self, kill=False):
+        """Stops the process, killing it right away if it may be wedged."""
+        if self.process is None:
             return
+        try:
+            if kill:
+                raise subprocess.TimeoutExpired(self.command, 0)
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.process = None
+
+class PlantUMLPipeRenderer(PersistentRenderer):
+    """
+    Keeps a single PlantUML JVM running in pipe mode. Each diagram is written
+    to stdin and the image is read back from stdout up to the pipe delimiter.
+    """
+    def __init__(self, command=None, timeout=RENDER_TIMEOUT_SECONDS, image_format="png"):
+        super().__init__((command or ["plantuml"]) + [f"-t{image_format}", "-pipe", "-pipedelimitor", PIPE_DELIMITER], timeout)
+
+    def _send(self, payload):
+        self.process.stdin.write(payload + b"\n")
+        self.process.stdin.flush()
+
+    def _receive(self):
+        # PlantUML terminates the delimiter with a platform newline, which ends
+        # up in front of the next image; PNG and SVG data never start with CR/LF.
+        image = self._read_until(PIPE_DELIMITER.encode("utf-8")).lstrip(b"\r\n")
+        if not image:
+            raise RendererError("PlantUML returned an empty image")
+        # On a syntax error PlantUML still sends an (error) image; the only sign
+        # is ERROR on stderr, which it writes before the delimiter.
+        self._poll_stderr()
+        if any(line.startswith("ERROR") for line in self._request_stderr):
+            raise DiagramError("\n".join(self._request_stderr))
+        return image
+
+class MermaidServerRenderer(PersistentRenderer):
+    """
+    Keeps a single headless browser alive through mermaidRenderer.mjs.
+    Requests are framed as "<length>\\n<source>", responses as
+    "OK <length>\\n<image>" or "ERR <length>\\n<message>".
+    """
+    def __init__(self, command=None, theme=THEMES["mermaid"], timeout=RENDER_TIMEOUT_SECONDS, image_format="png"):
+        super().__init__((command or ["node", MERMAID_RENDERER_SCRIPT]) + ["-t", theme, "-f", image_format], timeout)
+
+    def _send(self, payload):
+        self.process.stdin.write(f"{len(payload)}\n".encode("ascii") + payload)
+        self.process.stdin.flush()
+
+    def _receive(self):
+        header = self._read_until(b"\n").decode("ascii", errors="replace").split()
+        if len(header) != 2 or header[0] not in ("OK", "ERR") or not header[1].isdigit():
+            raise RendererError(f"Malformed renderer response header: {' '.join(header)!r}")
+        data = self._read_exact(int(header[1]))
+        if header[0] == "ERR":
+            raise DiagramError(data.decode("utf-8", errors="replace"))
+        return data
+
+class RendererPool:
+    """
+    A fixed number of persistent renderers per image format, shared by the
+    target workers. The renderers of a format are created on its first
+    render and each one is only started when first used.
+    """
+    def __init__(self, factory, size):
+        self._factory = factory
+        self._size = max(1, size)
+        self._renderers = []
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _idle_queue(self, image_format):
+        with self._lock:
+            if image_format not in self._idle:
+                idle = queue.Queue()
+                for _ in range(self._size):
+                    renderer = self._factory(image_format)
+                    self._renderers.append(renderer)
+                    idle.put(renderer)
+                self._idle[image_format] = idle
+            return self._idle[image_format]
+
+    def render(self, source, image_format="png"):
+        idle = self._idle_queue(image_format)
+        renderer = idle.get()
+        try:
+            return renderer.render(source)
+        finally:
+            idle.put(renderer)
+
+    def close(self):
+        for renderer in self._renderers:
+            renderer.close()
+
+def create_renderer_pool(diagram_type, size, renderer_cmd=None, timeout=RENDER_TIMEOUT_SECONDS):
+    """
+    Creates a pool of persistent renderers for the given diagram type.
+    renderer_cmd replaces the renderer executable (e.g. a local fake for tests).
+    A renderer that takes longer than timeout seconds for one diagram is killed.
+    """
+    command = shlex.split(renderer_cmd) if renderer_cmd else None
+    if diagram_type == "plantuml":
+        return RendererPool(lambda image_format: PlantUMLPipeRenderer(command, timeout, image_format), size)
+    return RendererPool(lambda image_format: MermaidServerRenderer(command, timeout=timeout, image_format=image_format), size)
+
+def run_persistent(renderer_pool, diagram_content, output_file, log=print):
+    """
+    Renders the diagram with a persistent renderer and writes the image bytes
+    straight to the output file. Returns True if the image was generated.
+    """
+    try:
+        fmt = image_format(output_file)
+        image = renderer_pool.render(diagram_content, fmt)
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        with open(output_file, "wb") as f:
+            f.write(image)
+        log(f"[INFO] {fmt.upper()} generated at: {os.path.abspath(output_file)}")
+        return True
+    except Exception as e:
+        log(f"[ERROR] Persistent renderer failed: {e}")
+        return False
+
+def _file_identity(arg):
+    """
+    Identity of one command argument: small files (scripts) by content hash,
+    large ones (interpreters) by path, size and mtime; anything else verbatim.
+    """
+    path = shutil.which(arg) or (arg if os.path.isfile(arg) else None)
+    if not path:
+        return arg
+    stat = os.stat(path)
+    if stat.st_size > 1024 * 1024:
+        return f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    with open(path, "rb") as f:
+        return f"{os.path.basename(path)}:{hashlib.sha256(f.read()).hexdigest()}"
+
+def _read_package(directory):
+    """Returns (name, version) from directory/package.json, or None."""
+    try:
+        with open(os.path.join(directory, "package.json"), "r", encoding="utf-8") as f:
+            package = json.load(f)
+        return package.get("name"), package.get("version")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _find_package(start, name):
+    """Walks up from start to the directory holding the package.json of name."""
+    directory = os.path.abspath(start)
+    while True:
+        package = _read_package(directory)
+        if package and package[0] == name:
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+def mermaid_cli_dir(mmdc=None):
+    """
+    Locates the installed @mermaid-js/mermaid-cli package: next to the mmdc
+    executable for the CLI renderer, otherwise the same way mermaidRenderer.mjs
+    does (node_modules above the script, then the global node_modules).
+    """
+    if mmdc:
+        path = shutil.which(mmdc)
+        return _find_package(os.path.dirname(os.path.realpath(path)), "@mermaid-js/mermaid-cli") if path else None
+    directory = os.path.dirname(MERMAID_RENDERER_SCRIPT)
+    while True:
+        candidate = os.path.join(directory, "node_modules", "@mermaid-js", "mermaid-cli")
+        if _read_package(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    try:
+        global_root = subprocess.run(["npm", "root", "-g"], capture_output=True, text=True, timeout=60).stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    candidate = os.path.join(global_root, "@mermaid-js", "mermaid-cli")
+    return candidate if global_root and _read_package(candidate) else None
+
+def mermaid_version(cli_dir):
+    """Versions of mermaid-cli and the mermaid library it renders with."""
+    parts = ["{}@{}".format(*_read_package(cli_dir))]
+    for candidate in (os.path.join(cli_dir, "node_modules", "mermaid"), os.path.join(os.path.dirname(os.path.dirname(cli_dir)), "mermaid")):
+        package = _read_package(candidate)
+        if package:
+            parts.append("{}@{}".format(*package))
+            break
+    return " ".join(parts)
+
+# A .jar path in a renderer's wrapper script, e.g. /usr/share/plantuml/plantuml.jar
+JAR_PATH_PATTERN = re.compile(r"""[^\s'"=:]+\.jar\b""")
+
+def plantuml_install_key(executable="plantuml"):
+    """
+    Identity of the PlantUML installation, cheap enough to compute on every
+    run: the realpath, size and mtime of the resolved plantuml script and of
+    the jars it names. None if plantuml is not on the PATH.
+    """
+    path = shutil.which(executable)
+    if not path:
+        return None
+    path = os.path.realpath(path)
+    paths = [path]
+    try:
+        if os.path.getsize(path) <= 64 * 1024:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                paths.extend(jar for jar in JAR_PATH_PATTERN.findall(f.read()) if os.path.isfile(jar))
+    except OSError:
+        pass
+    parts = []
+    for member in dict.fromkeys(paths):
+        stat = os.stat(member)
+        parts.append(f"{os.path.realpath(member)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return " ".join(parts)
+
+def cached_plantuml_version(versions_file):
+    """
+    plantuml_version(), remembered in versions_file under plantuml_install_key()
+    so that the JVM is only started again after PlantUML was reinstalled or
+    upgraded.
+    """
+    install_key = plantuml_install_key()
+    if install_key is None:
+        return None
+    try:
+        with open(versions_file, "r", encoding="utf-8") as f:
+            versions = json.load(f)
+    except (OSError, ValueError):
+        versions = {}
+    if not isinstance(versions, dict):
+        versions = {}
+    if install_key in versions:
+        return versions[install_key]
+    version = plantuml_version(["plantuml"])
+    if version:
+        versions[install_key] = version
+        try:
+            write_atomic(versions_file, json.dumps(versions, indent=2, sort_keys=True).encode("utf-8"))
+        except OSError:
+            pass
+    return version
+
+def plantuml_version(command):
+    """First line of `plantuml -version`, or None if PlantUML cannot be run."""
+    try:
+        result = subprocess.run(command + ["-version"], capture_output=True, text=True, stdin=subprocess.DEVNULL, timeout=120)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    return lines[0] if result.returncode == 0 and lines else None
+
+def renderer_version(diagram_type, renderer, renderer_cmd=None, versions_file=None):
+    """
+    Identity of the renderer installation, used in render cache keys and
+    computed once per run. PlantUML is asked for its version and mermaid-cli's
+    package.json is read, since wrapper scripts such as /usr/bin/plantuml do
+    not change when the renderer behind them is upgraded. The PlantUML version
+    is remembered in versions_file (if given) until the plantuml script or its
+    jar change, so runs that only hit the render cache start no JVM. A custom
+    renderer command is identified by its arguments and the scripts they name.
+    """
+    if renderer_cmd:
+        return " ".join(_file_identity(arg) for arg in shlex.split(renderer_cmd))
+    if diagram_type == "plantuml":
+        version = cached_plantuml_version(versions_file) if versions_file else plantuml_version(["plantuml"])
+        if version:
+            return version
+        command = ["plantuml"]
+    elif renderer == "warm":
+        cli_dir = mermaid_cli_dir()
+        if cli_dir:
+            return f"{mermaid_version(cli_dir)} {_file_identity(MERMAID_RENDERER_SCRIPT)}"
+        command = ["node", MERMAID_RENDERER_SCRIPT]
+    else:
+        cli_dir = mermaid_cli_dir("mmdc")
+        if cli_dir:
+            return mermaid_version(cli_dir)
+        command = ["mmdc"]
+    # Renderer not found; rendering will fail anyway, fall back to the executables
+    return " ".join(_file_identity(arg) for arg in command)
+
+def write_if_changed(path, content):
+    """
+    Writes text content to path atomically, but only if it differs from what
+    is already there. Returns True if the file was written.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    write_atomic(path, content.encode("utf-8"))
+    return True
+
+def write_atomic(path, data):
+    """
+    Writes bytes to a temporary file next to path and renames it into place,
+    so readers never see a partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+class RenderCache:
+    """
+    Content-addressed cache of rendered images. Entries are keyed by a hash of
+    the diagram text, diagram type, theme, image format and renderer version,
+    and stored as <key>.png or <key>.svg files. Reads refresh an entry's mtime,
+    and the least recently used entries are evicted once the cache grows
+    beyond max_bytes.
+    """
+    def __init__(self, directory, max_bytes, renderer_version):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.renderer_version = renderer_version
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, diagram_content, diagram_type, theme, image_format="png"):
+        digest = hashlib.sha256()
+        for part in (diagram_type, theme, self.renderer_version, image_format, diagram_content):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return f"{digest.hexdigest()}.{image_format}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, output_file):
+        """Copies the cached image to output_file. Returns True on a cache hit."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                image = f.read()
+            os.utime(path)
+        except OSError:
+            return False
+        write_atomic(output_file, image)
+        return True
+
+    def put(self, key, image_file):
+        """Stores a rendered image and evicts old entries if the cache is too large."""
+        with open(image_file, "rb") as f:
+            write_atomic(self._path(key), f.read())
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith((".png", ".svg")) and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            # Oldest entries first
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+# A ${...} reference, e.g. ${var.model_name} or ${bundle.target}
+REFERENCE_PATTERN = re.compile(r"\$\{([A-Za-z_][\w\-]*(?:\.[\w\-\[\]]+)*)\}")
+
+# Marker for references the interpolator does not know about
+_UNRESOLVED = object()
+
+class InterpolationError(Exception):
+    """Raised when variable references cannot be resolved, e.g. because they form a cycle."""
+
+class Interpolator:
+    """
+    Resolves ${...} references in a bundle tree for one target.
+
+    The tree is walked once. Containers without any reference are returned
+    as-is rather than copied, so unchanged subtrees are shared with the
+    input and between targets; callers must treat the result as read-only.
+    Variables are resolved lazily, may reference other variables or
+    bundle values, and reference cycles raise InterpolationError. Unknown
+    references (e.g. ${bundle.git.branch}) are left untouched.
+    """
+    def __init__(self, lookups, variables):
+        # Fixed references, e.g. {"bundle.target": "dev"}
+        self.lookups = lookups
+        # Variable name -> unresolved value
+        self.variables = variables
+        self._resolved_variables = {}
+        self._resolving = []
+        self._strings = {}
+
+    def resolve(self, node):
+        if isinstance(node, str):
+            return self._resolve_string(node)
+        if isinstance(node, dict):
+            resolved = None
+            for key, value in node.items():
+                new_value = self.resolve(value)
+                if new_value is not value:
+                    if resolved is None:
+                        resolved = dict(node)
+                    resolved[key] = new_value
+            return node if resolved is None else resolved
+        if isinstance(node, list):
+            resolved = None
+            for index, value in enumerate(node):
+                new_value = self.resolve(value)
+                if new_value is not value:
+                    if resolved is None:
+                        resolved = list(node)
+                    resolved[index] = new_value
+            return node if resolved is None else resolved
+        return node
+
+    def _resolve_string(self, text):
+        if "${" not in text:
+            return text
+        if text in self._strings:
+            return self._strings[text]
+
+        match = REFERENCE_PATTERN.fullmatch(text)
+        if match:
+            # A value that is a single reference keeps the type of what it refers to
+            value = self._lookup(match.group(1))
+            resolved = text if value is _UNRESOLVED else value
+        else:
+            def substitute(match):
+                value = self._lookup(match.group(1))
+                return match.group(0) if value is _UNRESOLVED else str(value)
+            resolved = REFERENCE_PATTERN.sub(substitute, text)
+        if resolved == text:
+            resolved = text
+        self._strings[text] = resolved
+        return resolved
+
+    def _lookup(self, name):
+        if name in self.lookups:
+            return self.lookups[name]
+        if not name.startswith("var."):
+            return _UNRESOLVED
+        variable = name[len("var."):]
+        if variable in self._resolved_variables:
+            return self._resolved_variables[variable]
+        if variable not in self.variables:
+            return _UNRESOLVED
+        if variable in self._resolving:
+            cycle = " -> ".join(f"var.{v}" for v in self._resolving[self._resolving.index(variable):] + [variable])
+            raise InterpolationError(f"Variable reference cycle: {cycle}")
+
+        self._resolving.append(variable)
+        try:
+            value = self.resolve(self.variables[variable])
+        finally:
+            self._resolving.pop()
+        self._resolved_variables[variable] = value
+        return value
+
+def create_interpolator(bundle_name, target_name, target_data, variables):
+    """
+    Creates the Interpolator for one target. Variable values are taken from the
+    target's 'variables' overrides, falling back to the variable's default;
+    variables without a value are left unresolved.
+    """
+    lookups = {
+        "bundle.name": bundle_name,
+        "bundle.target": target_name,
+        "workspace.current_user.userName": "[CURRENT USER]",
+    }
+    target_variables = target_data.get("variables") or {}
+    values = {}
+    for name, definition in (variables or {}).items():
+        if target_variables.get(name) is not None:
+            values[name] = target_variables[name]
+        elif isinstance(definition, dict) and definition.get("default") is not None:
+            values[name] = definition["default"]
+    return Interpolator(lookups, values)
+
+def render_diagram(diagram_content, source_file, png_file, diagram_type, renderer_pool=None, render_cache=None, log=print):
+    """
+    Saves the diagram source and renders it to png_file, reusing the render
+    cache when possible. SVG diagrams need no renderer and are written to
+    png_file (the .svg image file) directly, as are the files of the HTML
+    viewer, which is rendered in the browser. Returns True if the image was generated.
+    """
+    if diagram_type == "html":
+        write_if_changed(png_file, diagram_content)
+        return True
+    if diagram_type == "svg":
+        if write_if_changed(png_file, diagram_content):
+            log(f"[INFO] SVG generated at: {os.path.abspath(png_file)}")
+        else:
+            log(f"[INFO] SVG unchanged: {os.path.abspath(png_file)}")
+        return True
+
+    # Save the source file
+    if write_if_changed(source_file, diagram_content):
+        log(f"[INFO] Diagram source saved to: {os.path.abspath(source_file)}")
+    else:
+        log(f"[INFO] Diagram source unchanged: {os.path.abspath(source_file)}")
+
+    cache_key = None
+    if render_cache is not None:
+        cache_key = render_cache.key(diagram_content, diagram_type, THEMES[diagram_type], image_format(png_file))
+        if render_cache.get(cache_key, png_file):
+            log(f"[INFO] Render cache hit, {image_format(png_file).upper()} reused at: {os.path.abspath(png_file)}")
+            return True
+
+    # Render the diagram
+    if renderer_pool is not None:
+        rendered = run_persistent(renderer_pool, diagram_content, png_file, log=log)
+    elif diagram_type == "plantuml":
+        rendered = run_plantuml(diagram_content, png_file, log=log)
+    else:
+        rendered = run_mermaid(diagram_content, png_file, log=log)
+    if rendered and cache_key is not None:
+        render_cache.put(cache_key, png_file)
+    return rendered
+
+class TargetResult:
+    """Outcome of process_target for one target."""
+    __slots__ = ("success", "log_lines", "fingerprints", "timings", "diagrams")
+
+    def __init__(self, success, log_lines, fingerprints=None, timings=None, diagrams=None):
+        self.success = success
+        self.log_lines = log_lines
+        self.fingerprints = fingerprints
+        self.timings = timings
+        # image file -> diagram text of the diagrams that were generated
+        self.diagrams = diagrams or {}
+
+def process_target(graph, variables, target_name, target_data, diagram_type, output, renderer_pool=None, render_cache=None, max_nodes=None, previous_fingerprints=None, job_patterns=None, with_upstream=False, previous_diagrams=None):
+    """
+    Runs the resolve -> build -> render pipeline for a single target of the
+    bundle graph.
+    Log lines are collected instead of printed so that targets processed
+    concurrently can be reported in a deterministic order.
+    If a renderer_pool is given, diagrams are rendered by its persistent
+    renderers instead of one CLI process per target. If a render_cache is
+    given, unchanged diagrams reuse the cached PNG instead of being rendered.
+    Targets with more than max_nodes nodes are split into an overview and
+    several part diagrams.
+    If previous_fingerprints (from a manifest) are given, only the jobs that
+    changed since then are rendered, highlighted, together with their direct
+    neighbours, as <target>_changed.
+    If job_patterns are given, only the matching jobs (and with with_upstream
+    the jobs they depend on) are resolved and drawn; the others are dropped
+    before variable resolution.
+    Diagrams whose text is the same as in previous_diagrams (the diagrams of
+    an earlier TargetResult) and whose image still exists are not rendered
+    again.
+    Returns a TargetResult with the job fingerprints of the target and the
+    time spent in each stage.
+    """
+    log_lines = []
+    log = log_lines.append
+    timings = {"resolve_seconds": None, "build_seconds": None, "render_seconds": None, "diagrams": 0}
+    generated = {}
+
+    def result(success, fingerprints=None):
+        timings["exit_code"] = 0 if success else 1
+        return TargetResult(success, log_lines, fingerprints, timings, generated)
+
+    try:
+        start = time.perf_counter()
+        job_ids = None
+        if job_patterns:
+            job_ids = graph.select_jobs(target_data, job_patterns, with_upstream)
+            if not job_ids:
+                timings["resolve_seconds"] = time.perf_counter() - start
+                log(f"[WARNING] No jobs matching {', '.join(job_patterns)} in environment '{target_name}', nothing to render")
+                return result(True)
+            # Overrides of jobs that are not drawn are not resolved either
+            resources = target_data.get("resources") or {}
+            if resources.get("jobs"):
+                selected = set(job_ids)
+                target_data = dict(target_data, resources=dict(
+                    resources, jobs={job_id: job for job_id, job in resources["jobs"].items() if job_id in selected}
+                ))
+        interpolator = create_interpolator(graph.bundle_name, target_name, target_data, variables)
+        target_data_resolved = interpolator.resolve(target_data)
+        target_graph = graph.for_target(target_name, target_data_resolved, interpolator, job_ids)
+        fingerprints = job_fingerprints(target_graph)
+        for job_id, job in target_graph.jobs.items():
+            for cycle in job.analysis.cycles:
+                log(f"[WARNING] Job '{job_id}' in environment '{target_name}' has a depends_on cycle between tasks: {', '.join(map(str, cycle))}")
+            for task_key, dependency in job.analysis.unresolved:
+                log(f"[WARNING] Task '{task_key}' of job '{job_id}' in environment '{target_name}' depends on unknown task '{dependency}'")
+
+        name = None
+        if previous_fingerprints is not None:
+            changed = changed_jobs(target_graph, fingerprints, previous_fingerprints)
+            if not changed:
+                timings["resolve_seconds"] = time.perf_counter() - start
+                log(f"[INFO] No jobs changed in environment '{target_name}', nothing to render")
+                return result(True, fingerprints)
+            selected = set(changed) | target_graph.neighbours(changed)
+            log(f"[INFO] Changed jobs in environment '{target_name}': {', '.join(changed)}")
+            target_graph = target_graph.subset(
+                [job_id for job_id in target_graph.jobs if job_id in selected],
+                highlighted=frozenset(changed)
+            )
+            name = f"{target_name}_changed"
+        timings["resolve_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        diagrams = build_diagrams(target_graph, diagram_type, output, max_nodes, name)
+        timings["build_seconds"] = time.perf_counter() - start
+        timings["diagrams"] = len(diagrams)
+        if len(diagrams) > 1 and diagram_type != "html":
+            log(f"[INFO] Environment '{target_name}' split into an overview and {len(diagrams) - 1} part(s)")
+
+        success = True
+        start = time.perf_counter()
+        for source_file, png_file, diagram_content in diagrams:
+            if (previous_diagrams or {}).get(png_file) == diagram_content and os.path.exists(png_file):
+                if diagram_type != "html":
+                    log(f"[INFO] Diagram unchanged, not rendered again: {os.path.abspath(png_file)}")
+                generated[png_file] = diagram_content
+            elif render_diagram(diagram_content, source_file, png_file, diagram_type, renderer_pool, render_cache, log=log):
+                generated[png_file] = diagram_content
+            else:
+                log(f"[ERROR] Failed to render diagram for environment '{target_name}': {os.path.abspath(png_file)}")
+                success = False
+        timings["render_seconds"] = time.perf_counter() - start
+        if success:
+            log(f"[INFO] Generated diagram for environment '{target_name}': {os.path.abspath(diagrams[0][1])}")
+        return result(success, fingerprints)
+    except Exception as e:
+        log(f"[ERROR] Failed to process environment '{target_name}': {e}")
+        return result(False)
+
+# Cluster fields that can be looked up with query --cluster FIELD=VALUE
+CLUSTER_QUERY_FIELDS = (
+    "spark_version", "node_type_id", "driver_node_type_id", "runtime_engine",
+    "policy_id", "instance_pool_id", "data_security_mode", "existing_cluster_id"
+)
+QUERY_KINDS = ("cluster", "notebook", "wheel", "dependents", "recipient")
+
+def _index_add(index, key, value):
+    # Values are kept in dicts used as insertion-ordered sets
+    index.setdefault(key, {})[value] = None
+
+class QueryIndex:
+    """
+    Inverted indexes over the resolved jobs of one target, used by the query
+    subcommand: cluster field value -> jobs, notebook path and wheel (package
+    name or library file) -> tasks, task -> tasks that depend on it and
+    notification recipient -> jobs. Built in one pass over the jobs, so every
+    lookup is a dict access.
+    """
+    __slots__ = ("clusters", "notebooks", "wheels", "dependents", "dependents_by_key", "recipients")
+
+    def __init__(self, target_graph):
+        self.clusters = {}           # (field, value) -> {job id}
+        self.notebooks = {}          # notebook path -> {(job id, task key)}
+        self.wheels = {}             # package name or .whl path -> {(job id, task key)}
+        self.dependents = {}         # (job id, task key) -> {(job id, dependent task key)}
+        self.dependents_by_key = {}  # task key -> {(job id, dependent task key)}, over all jobs
+        self.recipients = {}         # recipient -> {(job id, task key or None, notification type)}
+        for job_id in target_graph.jobs:
+            self._add_job(job_id, target_graph.text(target_graph.raw_jobs.get(job_id) or {}))
+
+    def _add_cluster(self, job_id, spec):
+        for field in CLUSTER_QUERY_FIELDS:
+            value = spec.get(field)
+            if value is not None and not isinstance(value, (dict, list)):
+                _index_add(self.clusters, (field, str(value)), job_id)
+
+    def _add_notifications(self, job_id, task_key, notifications):
+        for notification_type, recipients in (notifications or {}).items():
+            if isinstance(recipients, list):
+                for recipient in recipients:
+                    _index_add(self.recipients, str(recipient), (job_id, task_key, notification_type))
+
+    def _add_job(self, job_id, job):
+        for job_cluster in job.get("job_clusters") or []:
+            self._add_cluster(job_id, job_cluster.get("new_cluster") or {})
+        self._add_notifications(job_id, None, job.get("email_notifications"))
+
+        for task in job.get("tasks") or []:
+            task_key = task.get("task_key")
+            if not task_key:
+                continue
+            self._add_cluster(job_id, task.get("new_cluster") or {})
+            if task.get("existing_cluster_id"):
+                self._add_cluster(job_id, {"existing_cluster_id": task["existing_cluster_id"]})
+            notebook_path = (task.get("notebook_task") or {}).get("notebook_path")
+            if notebook_path:
+                _index_add(self.notebooks, str(notebook_path), (job_id, task_key))
+            package_name = (task.get("python_wheel_task") or {}).get("package_name")
+            if package_name:
+                _index_add(self.wheels, str(package_name), (job_id, task_key))
+            for library in task.get("libraries") or []:
+                if isinstance(library, dict) and library.get("whl"):
+                    _index_add(self.wheels, str(library["whl"]), (job_id, task_key))
+            for dep_item in task.get("depends_on") or []:
+                dep_key = dep_item.get("task_key")
+                if dep_key:
+                    _index_add(self.dependents, (job_id, dep_key), (job_id, task_key))
+                    _index_add(self.dependents_by_key, dep_key, (job_id, task_key))
+            self._add_notifications(job_id, task_key, task.get("email_notifications"))
 
-        print(f"[INFO] PNG generated at: {os.path.abspath(output_file)}")
-    # except Exception as e:
-    #     print(f"[ERROR] Exception during Mermaid CLI execution: {e}")
-    # finally:
-    #     if os.path.exists(tmp_name):
-    #         os.remove(tmp_name)
+    def lookup(self, kind, value):
+        """
+        Answers one query (see QUERY_KINDS) and returns the matches as a list
+        of dicts. cluster takes "FIELD=VALUE", dependents "TASK" or "JOB.TASK".
+        """
+        if kind == "cluster":
+            field, _, field_value = value.partition("=")
+            return [{"job": job_id} for job_id in self.clusters.get((field, field_value), ())]
+        if kind in ("notebook", "wheel"):
+            index = self.notebooks if kind == "notebook" else self.wheels
+            return [{"job": job_id, "task": task_key} for job_id, task_key in index.get(value, ())]
+        if kind == "dependents":
+            job_id, _, task_key = value.rpartition(".")
+            matches = self.dependents.get((job_id, task_key), ()) if job_id else self.dependents_by_key.get(task_key, ())
+            return [{"job": job_id, "task": task_key} for job_id, task_key in matches]
+        if kind == "recipient":
+            matches = []
+            for job_id, task_key, notification_type in self.recipients.get(value, ()):
+                match = {"job": job_id, "type": notification_type}
+                if task_key is not None:
+                    match["task"] = task_key
+                matches.append(match)
+            return matches
+        raise ValueError(f"Unknown query '{kind}', expected one of {', '.join(QUERY_KINDS)}")
+
+def format_match(match):
+    """Formats a query match for the text output, e.g. job.task (on_failure)."""
+    text = match["job"] if "task" not in match else f"{match['job']}.{match['task']}"
+    if "type" in match:
+        text += f" ({match['type']})"
+    return text
+
+def query_main(argv):
+    """The query subcommand: looks up jobs and tasks in the resolved bundle."""
+    def query(kind):
+        def parse(value):
+            if kind == "cluster":
+                field, separator, _ = value.partition("=")
+                if not separator or field not in CLUSTER_QUERY_FIELDS:
+                    raise argparse.ArgumentTypeError(
+                        f"expected FIELD=VALUE with FIELD one of {', '.join(CLUSTER_QUERY_FIELDS)}"
+                    )
+            return kind, value
+        return parse
+
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} query",
+        description="Look up jobs and tasks in a Databricks asset bundle, resolved per target. "
+                    "Queries can be repeated and are answered in the order given."
+    )
+    parser.add_argument("-i", "--input", help="Path to databricks.yml file", default="databricks.yml")
+    parser.add_argument(
+        "--target",
+        help="Target to resolve the bundle for. Can be repeated (default: all targets)",
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--cluster", metavar="FIELD=VALUE", dest="queries", action="append", type=query("cluster"),
+        help=f"Jobs with a cluster whose FIELD has VALUE, FIELD one of {', '.join(CLUSTER_QUERY_FIELDS)}"
+    )
+    parser.add_argument(
+        "--notebook", metavar="PATH", dest="queries", action="append", type=query("notebook"),
+        help="Tasks running the notebook, with the path as written in the bundle"
+    )
+    parser.add_argument(
+        "--wheel", metavar="NAME", dest="queries", action="append", type=query("wheel"),
+        help="Tasks running the python wheel package NAME or installing the .whl library NAME"
+    )
+    parser.add_argument(
+        "--dependents", metavar="[JOB.]TASK", dest="queries", action="append", type=query("dependents"),
+        help="Tasks that directly depend on TASK (depends_on), in JOB or in any job"
+    )
+    parser.add_argument(
+        "--recipient", metavar="EMAIL", dest="queries", action="append", type=query("recipient"),
+        help="Jobs and tasks that send email notifications to EMAIL"
+    )
+    parser.add_argument("--json", help="Print the results as JSON", action="store_true")
+    parser.add_argument(
+        "--cache-dir",
+        help=f"Directory for the parsed YAML cache (default: {DEFAULT_CACHE_DIR})",
+        default=DEFAULT_CACHE_DIR
+    )
+    parser.add_argument("--no-cache", help="Disable the parsed YAML cache", action="store_true")
+    parser.add_argument(
+        "--merge-policy",
+        help="How to combine a resource defined in several files, as TYPE=POLICY (see the main command)",
+        action="append",
+        default=[]
+    )
+    args = parser.parse_args(argv)
+    if not args.queries:
+        parser.error("no query given, use at least one of --cluster, --notebook, --wheel, --dependents, --recipient")
+    try:
+        merge_policies = parse_merge_policies(args.merge_policy)
+    except ValueError as e:
+        parser.error(str(e))
+
+    yaml_cache = None if args.no_cache else YamlCache(os.path.join(args.cache_dir, "yaml"))
+    try:
+        bundle_name, resources, targets, variables = load_bundle_yaml(
+            args.input, yaml_cache, merge_policies=merge_policies
+        )
+    except MergeConflictError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    unknown = [target_name for target_name in args.target if target_name not in targets]
+    if unknown:
+        parser.error(f"unknown target(s) {', '.join(unknown)}, the bundle defines {', '.join(targets) or 'none'}")
+
+    graph = BundleGraph(bundle_name, resources)
+    results = {}
+    for target_name in args.target or list(targets):
+        target_data = targets[target_name] or {}
+        interpolator = create_interpolator(bundle_name, target_name, target_data, variables)
+        index = QueryIndex(graph.for_target(target_name, interpolator.resolve(target_data), interpolator))
+        results[target_name] = [
+            {"query": kind, "value": value, "matches": index.lookup(kind, value)}
+            for kind, value in args.queries
+        ]
+
+    if args.json:
+        print(json.dumps({"bundle": bundle_name, "targets": results}, indent=2))
+        return 0
+    for target_name, answers in results.items():
+        for answer in answers:
+            matches = ", ".join(format_match(match) for match in answer["matches"]) or "no matches"
+            print(f"[{target_name}] {answer['query']} {answer['value']}: {matches}")
+    return 0
 
 def main():
+    if sys.argv[1:2] == ["query"]:
+        return query_main(sys.argv[2:])
     parser = argparse.ArgumentParser(
-        description="Generate UML visualization from Databricks YAML asset bundle definitions. One PNG per environment."
+        description="Generate UML visualization from Databricks YAML asset bundle definitions. One PNG per environment.",
+        epilog=f"Run '{os.path.basename(sys.argv[0])} query -h' to look up jobs and tasks in the bundle instead."
     )
     parser.add_argument(
         "-i", "--input", 
@@ -418,62 +2541,531 @@ def main():
     )
     parser.add_argument(
         "-t", "--type", 
-        help="Diagram generation type (default: mermaid). Options: mermaid, plantuml",
+        help="Diagram generation type (default: mermaid). Options: mermaid, plantuml, "
+             "svg (built-in layout written directly as <base>_<env>.svg, no PlantUML or Mermaid needed), "
+             "html (searchable viewer <base>_<env>.html that renders each job with Mermaid in the browser when it is expanded)",
         default="mermaid",
-        choices=["mermaid", "plantuml"]
+        choices=["mermaid", "plantuml", "svg", "html"]
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        help="Number of targets to process in parallel (default: 1). Use 0 for one worker per CPU core.",
+        default=1,
+        type=int
+    )
+    parser.add_argument(
+        "--renderer",
+        help="Rendering backend (default: cli). 'cli' starts plantuml/mmdc once per target, "
+             "'warm' keeps one PlantUML pipe / headless browser per worker alive for the whole run",
+        default="cli",
+        choices=["cli", "warm"]
+    )
+    parser.add_argument(
+        "--renderer-cmd",
+        help="Command used to start the warm renderer instead of 'plantuml' or 'node mermaidRenderer.mjs' "
+             "(e.g. 'python src/fakeRenderer.py' for tests)",
+        default=None
+    )
+    parser.add_argument(
+        "--render-timeout",
+        help=f"Seconds a warm renderer may take for one diagram before it is killed and restarted (default: {RENDER_TIMEOUT_SECONDS})",
+        type=float,
+        default=RENDER_TIMEOUT_SECONDS
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=f"Directory for the parsed YAML and rendered PNG caches (default: {DEFAULT_CACHE_DIR}). "
+             "Point this at a persisted directory to keep the caches between CI runs.",
+        default=DEFAULT_CACHE_DIR
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Disable the parsed YAML and rendered PNG caches",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--render-cache-mb",
+        help="Maximum size of the render cache in MB (default: 256). Least recently used images are evicted first.",
+        default=256,
+        type=int
+    )
+    parser.add_argument(
+        "--merge-policy",
+        help="How to combine a resource defined in several files, as TYPE=POLICY with POLICY one of "
+             f"{', '.join(MERGE_POLICIES)}. Can be repeated; TYPE '*' sets the default "
+             "(default: jobs=merge, *=override)",
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--max-nodes",
+        help="Split environments with more diagram nodes than this into one diagram per group of jobs, "
+             "plus an SVG overview of jobs and shared clusters linking to the parts (default: no splitting)",
+        default=None,
+        type=int
+    )
+    parser.add_argument(
+        "--changed-since",
+        help="Path to a manifest.json from a previous run. Only jobs whose fingerprint changed are rendered "
+             "(highlighted, with their directly connected jobs) to <base>_<env>_changed.png",
+        default=None
+    )
+    parser.add_argument(
+        "--targets",
+        help="Only process the targets matching these glob patterns, comma separated or repeated (e.g. 'prod', 'dev*')",
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--select-jobs",
+        help="Only resolve and draw the jobs matching these glob patterns, comma separated or repeated "
+             "(e.g. 'ingest_*'). Other jobs are skipped before variable resolution. "
+             "No manifest is written when --targets or --select-jobs is used",
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--with-upstream",
+        help="With --select-jobs, also draw the jobs the selected jobs depend on (run_job_task), transitively",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--root",
+        help="Process every bundle (databricks.yml) found below this directory in one run instead of --input, "
+             "sharing the caches and renderers. Outputs mirror the directory layout next to --output, "
+             "and an index.json of all bundles, targets and job counts is written there",
+        default=None
+    )
+    parser.add_argument(
+        "--watch",
+        help="Keep running after the first build and rebuild whenever databricks.yml or an included file changes. "
+             "Only changed files are parsed again and only diagrams whose text changed are rendered again",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--watch-interval",
+        help="Seconds between two checks for changed files in --watch mode (default: 0.5)",
+        default=0.5,
+        type=float
+    )
+    parser.add_argument(
+        "--timings",
+        help="Write the time spent per included file and per target stage (resolve, build, render), "
+             "the exit code per target and the totals as JSON to this file",
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Write a cProfile dump of the run to this file (read it with python -m pstats or snakeviz)",
+        default=None
     )
     args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 or a positive integer")
+    if args.root is not None and args.changed_since:
+        parser.error("--changed-since reads the manifest of a single bundle and cannot be combined with --root")
+    if args.root is not None and args.watch:
+        parser.error("--watch follows a single bundle and cannot be combined with --root")
+    if args.watch_interval <= 0:
+        parser.error("--watch-interval must be a positive number of seconds")
+    if args.root is not None and not os.path.isdir(args.root):
+        parser.error(f"--root {args.root} is not a directory")
+    if args.max_nodes is not None and args.max_nodes < 1:
+        parser.error("--max-nodes must be a positive integer")
+    try:
+        merge_policies = parse_merge_policies(args.merge_policy)
+    except ValueError as e:
+        parser.error(str(e))
+    jobs = args.jobs or os.cpu_count() or 1
+
+    profiles = None
+    if args.profile:
+        profiles = [cProfile.Profile()]
+        profiles[0].enable()
+    start = time.perf_counter()
+    timings = {"input": args.root or args.input, "type": args.type, "workers": jobs}
+    try:
+        exit_code = run(args, jobs, merge_policies, timings, profiles)
+    finally:
+        if profiles is not None:
+            profiles[0].disable()
+    timings["total_seconds"] = time.perf_counter() - start
+    timings["exit_code"] = exit_code
+
+    if args.profile:
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(args.profile)
+        print(f"[INFO] Profile saved to: {os.path.abspath(args.profile)}")
+    if args.timings:
+        write_atomic(args.timings, (json.dumps(timings, indent=2) + "\n").encode("utf-8"))
+        print(f"[INFO] Timings saved to: {os.path.abspath(args.timings)}")
+    return exit_code
+
+def profiled(profiles, func, *args):
+    """
+    Runs func(*args) under a cProfile.Profile of its own, added to profiles,
+    so that work done in pool threads shows up in the --profile dump. Where
+    the interpreter profiles all threads with one profiler (Python 3.12+), a
+    second one cannot be enabled and func simply runs under the main one.
+    """
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return func(*args)
+    try:
+        return func(*args)
+    finally:
+        profile.disable()
+        profiles.append(profile)
+
+def split_patterns(values):
+    """Splits repeated, comma separated --targets / --select-jobs values into a list of glob patterns."""
+    return [pattern.strip() for value in values for pattern in value.split(",") if pattern.strip()]
+
+# File names of a bundle's main configuration, looked for by --root
+BUNDLE_FILE_NAMES = ("databricks.yml", "databricks.yaml")
+# Directories --root does not descend into, besides hidden ones (.git, .databricks, .venv, ...)
+DISCOVERY_SKIP_DIRS = {"node_modules", "__pycache__", "venv"}
+
+def discover_bundles(root):
+    """
+    Finds the main configuration file of every bundle below root. Hidden
+    directories and DISCOVERY_SKIP_DIRS are not searched. Returns the paths
+    in sorted order.
+    """
+    bundle_files = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = [
+            subdirectory for subdirectory in subdirectories
+            if not subdirectory.startswith(".") and subdirectory not in DISCOVERY_SKIP_DIRS
+        ]
+        for file_name in BUNDLE_FILE_NAMES:
+            if file_name in files:
+                bundle_files.append(os.path.join(directory, file_name))
+                break
+    return sorted(bundle_files)
+
+def bundle_output(output, root, main_yaml_path):
+    """
+    Returns the output base name of a bundle found by --root: the directory
+    layout below root is mirrored next to output, e.g. the bundle in
+    <root>/team_a/etl is written to figures/team_a/etl/dabs_visualization for
+    output figures/dabs_visualization.
+    """
+    relative = os.path.relpath(os.path.dirname(os.path.abspath(main_yaml_path)), os.path.abspath(root))
+    if relative == os.curdir:
+        return output
+    return os.path.join(os.path.dirname(output), relative, os.path.basename(output))
+
+class BundleRun:
+    """
+    One bundle processed by run(): where it is read from and written to, the
+    loaded bundle and the results of its targets.
+    """
+    __slots__ = ("input", "output", "label", "graph", "targets", "variables", "error", "timings", "results")
+
+    def __init__(self, input_path, output, label, timings):
+        self.input = input_path
+        self.output = output
+        self.label = label
+        self.graph = None
+        self.targets = {}
+        self.variables = {}
+        self.error = None
+        self.timings = timings
+        self.results = {}
+
+def load_bundles(bundle_runs, yaml_cache, jobs, merge_policies):
+    """
+    Loads every bundle and builds its BundleGraph. Several bundles are loaded
+    concurrently, and their include files are parsed on one process pool
+    shared by all of them. A bundle that cannot be loaded gets its error set.
+    """
+    def load(bundle_run, executor=None):
+        try:
+            bundle_name, resources, bundle_run.targets, bundle_run.variables = load_bundle_yaml(
+                bundle_run.input, yaml_cache, workers=jobs, merge_policies=merge_policies,
+                timings=bundle_run.timings, executor=executor
+            )
+        except (MergeConflictError, ValueError) as e:
+            bundle_run.error = str(e)
+            return
+        except (OSError, yaml.YAMLError) as e:
+            bundle_run.error = f"Failed to load {bundle_run.input}: {e}"
+            return
+        bundle_run.timings["bundle"] = bundle_name
+        # The diagram model is built once and shared by all targets
+        start = time.perf_counter()
+        bundle_run.graph = BundleGraph(bundle_name, resources)
+        bundle_run.timings["graph_seconds"] = time.perf_counter() - start
+
+    if len(bundle_runs) > 1 and jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as parse_executor, ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(lambda bundle_run: load(bundle_run, parse_executor), bundle_runs))
+    else:
+        for bundle_run in bundle_runs:
+            load(bundle_run)
+
+def write_index(index_file, root, bundle_runs):
+    """
+    Writes the --root index: every bundle found with its name, location,
+    output base name, number of jobs and, per target, the number of jobs and
+    whether it was rendered. Paths are relative to the index file.
+    """
+    index_dir = os.path.dirname(os.path.abspath(index_file))
+    bundles = []
+    for bundle_run in bundle_runs:
+        entry = {
+            "path": os.path.relpath(os.path.abspath(bundle_run.input), os.path.abspath(root)),
+            "output": os.path.relpath(os.path.abspath(bundle_run.output), index_dir),
+        }
+        if bundle_run.error is not None:
+            entry["error"] = bundle_run.error
+        else:
+            entry["name"] = bundle_run.graph.bundle_name
+            entry["jobs"] = len(bundle_run.graph.job_ids)
+            entry["targets"] = {
+                target_name: {
+                    "jobs": len(result.fingerprints) if result.fingerprints is not None else None,
+                    "success": result.success,
+                }
+                for target_name, result in bundle_run.results.items()
+            }
+        bundles.append(entry)
+    index = {"bundles": bundles}
+    return write_if_changed(index_file, json.dumps(index, indent=2) + "\n")
+
+def select_targets(targets, patterns):
+    """Returns the targets whose names match any of the glob patterns, or all targets if there are none."""
+    if not patterns:
+        return targets
+    return {
+        target_name: target_data for target_name, target_data in targets.items()
+        if any(fnmatch.fnmatchcase(target_name, pattern) for pattern in patterns)
+    }
+
+def load_state(bundle_run, state, target_patterns):
+    """
+    Merges the parsed files of a BundleState into bundle_run (see
+    load_bundles). Returns False if the bundle could not be loaded.
+    """
+    try:
+        bundle_name, resources, targets, bundle_run.variables = state.load()
+    except (MergeConflictError, ValueError) as e:
+        bundle_run.error = str(e)
+        return False
+    bundle_run.error = None
+    bundle_run.targets = select_targets(targets, target_patterns)
+    bundle_run.timings["bundle"] = bundle_name
+    bundle_run.graph = BundleGraph(bundle_name, resources)
+    return True
+
+def process_targets(args, tasks, workers, renderer_pool, render_cache, previous_manifest, job_patterns, profiles=None):
+    """
+    Runs process_target for every (bundle_run, target name, target data) in
+    tasks on a thread pool, prints the log lines in task order and stores
+    the results in the bundle runs. Returns the names of the failed targets.
+    """
+    # For each environment/target, build a separate .puml/.mmd and .png.
+    # Renders happen in external processes, so a thread pool is enough to keep
+    # several of them busy at once; results are reported in target order.
+    # With --root, the targets of all bundles share the pool, renderers and caches.
+    previous_results = {}
+    for bundle_run, _, _ in tasks:
+        if id(bundle_run) not in previous_results:
+            previous_results[id(bundle_run)] = bundle_run.results
+            bundle_run.results = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for bundle_run, target_name, target_data in tasks:
+            previous_result = previous_results[id(bundle_run)].get(target_name)
+            task = (
+                process_target, bundle_run.graph, bundle_run.variables,
+                target_name, target_data, args.type, bundle_run.output, renderer_pool, render_cache, args.max_nodes,
+                None if previous_manifest is None else previous_manifest.get(target_name, {}),
+                job_patterns, args.with_upstream, None if previous_result is None else previous_result.diagrams
+            )
+            if profiles is not None:
+                task = (profiled, profiles) + task
+            futures.append((bundle_run, target_name, executor.submit(*task)))
+        for bundle_run, target_name, future in futures:
+            if bundle_run.label is not None and not bundle_run.results:
+                print(f"[INFO] Bundle '{bundle_run.graph.bundle_name}' ({bundle_run.label})")
+            result = future.result()
+            for line in result.log_lines:
+                print(line)
+            if not result.success:
+                failed.append(target_name if bundle_run.label is None else f"{bundle_run.label}:{target_name}")
+            bundle_run.results[target_name] = result
+            bundle_run.timings.setdefault("targets", {})[target_name] = result.timings
+    return failed
+
+def write_manifest(bundle_run):
+    """Writes the job fingerprints of a bundle run to <output>/manifest.json for later --changed-since runs."""
+    manifest_file = f"{bundle_run.output}/manifest.json"
+    fingerprints = {
+        target_name: result.fingerprints
+        for target_name, result in bundle_run.results.items() if result.fingerprints is not None
+    }
+    manifest = {"bundle": bundle_run.graph.bundle_name, "targets": fingerprints}
+    if write_if_changed(manifest_file, json.dumps(manifest, indent=2, sort_keys=True) + "\n"):
+        print(f"[INFO] Manifest saved to: {os.path.abspath(manifest_file)}")
+
+def watch_bundle(args, bundle_run, state, workers, renderer_pool, render_cache, previous_manifest, target_patterns, job_patterns, profiles=None):
+    """
+    --watch: polls databricks.yml and the included files and, once they have
+    not changed for WATCH_DEBOUNCE_SECONDS, reparses the changed files,
+    merges again and processes the targets. Diagrams whose text did not
+    change are not rendered again. Runs until interrupted and returns the
+    exit code of the last build.
+    """
+    exit_code = 0
+    print(f"[INFO] Watching {len(state.resource_files) + 1} file(s) for changes, press Ctrl+C to stop")
+    stamps = state.stamps()
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+            current = state.stamps()
+            if current == stamps:
+                continue
+            # Wait for the burst of changes to end
+            while True:
+                time.sleep(WATCH_DEBOUNCE_SECONDS)
+                stamps, current = current, state.stamps()
+                if current == stamps:
+                    break
+            changed = state.refresh()
+            stamps = state.stamps()
+            print(f"[INFO] Changed: {', '.join(changed)}")
+            if not load_state(bundle_run, state, target_patterns):
+                print(f"[ERROR] {bundle_run.error}")
+                exit_code = 1
+                continue
+            tasks = [(bundle_run, target_name, target_data) for target_name, target_data in bundle_run.targets.items()]
+            failed = process_targets(args, tasks, workers, renderer_pool, render_cache, previous_manifest, job_patterns, profiles)
+            if not target_patterns and not job_patterns:
+                write_manifest(bundle_run)
+            if failed:
+                print(f"[ERROR] {len(failed)} of {len(tasks)} environment(s) failed: {', '.join(failed)}")
+            exit_code = 1 if failed else 0
+    except KeyboardInterrupt:
+        print("[INFO] Stopped watching")
+    return exit_code
+
+def run(args, jobs, merge_policies, timings, profiles=None):
+    """
+    Loads the bundle (or, with --root, every bundle found) and processes all
+    of its targets as requested by the parsed command line args. Load and
+    per-target stage times are recorded in timings. With --watch, the bundle
+    is then rebuilt whenever its files change. Returns the exit code.
+    """
+    yaml_cache = None if args.no_cache else YamlCache(os.path.join(args.cache_dir, "yaml"))
+
+    if args.root is None:
+        # A single bundle records its timings at the top level
+        bundle_runs = [BundleRun(args.input, args.output, None, timings)]
+    else:
+        bundle_files = discover_bundles(args.root)
+        if not bundle_files:
+            print(f"[ERROR] No {' or '.join(BUNDLE_FILE_NAMES)} found under {args.root}")
+            return 1
+        print(f"[INFO] Found {len(bundle_files)} bundle(s) under {os.path.abspath(args.root)}")
+        bundle_runs = [
+            BundleRun(
+                bundle_file, bundle_output(args.output, args.root, bundle_file),
+                os.path.relpath(os.path.dirname(os.path.abspath(bundle_file)), os.path.abspath(args.root)),
+                {"input": bundle_file}
+            )
+            for bundle_file in bundle_files
+        ]
+        timings["bundles"] = [bundle_run.timings for bundle_run in bundle_runs]
+
+    target_patterns = split_patterns(args.targets)
+    job_patterns = split_patterns(args.select_jobs)
 
     # Load YAML data
-    bundle_name, resources, targets, variables = load_bundle_yaml(args.input)
-
-    def get_replacements(data, variables):
-        replacements = {}
-        for k,v in variables.items(): 
-            var = v.get('default', None)
-            target_var = data.get('variables', {}).get(k, None)
-            replacements[r'${var.'+k+r'}'] = target_var if target_var else var
-        return replacements 
-
-    def resolve_replacements(data, variables):
-        data_str = json.dumps(data)
-        for k, v in variables.items():
-            data_str = data_str.replace(k, str(v))
-        return json.loads(data_str)
-
-    # For each environment/target, build a separate .puml/.mmd and .png
-    for target_name, target_data in targets.items():
-
-        replacements = {r'${bundle.target}': target_name}
-        replacements['${workspace.current_user.userName}'] = '[CURRENT USER]'
-        variables_resolved = resolve_replacements(variables, replacements)
-        variable_replacements = get_replacements(target_data, variables_resolved)
-        target_data_resolved = resolve_replacements(target_data, variable_replacements | replacements)
-        resources_resolved = resolve_replacements(resources, variable_replacements | replacements)
-
-        # Choose diagram generation method based on type
-        if args.type == "plantuml":
-            diagram_content = build_plantuml_for_target(bundle_name, resources_resolved, target_name, target_data_resolved)
-            file_ext = "puml"
-            render_func = run_plantuml
-        elif args.type == "mermaid":
-            diagram_content = build_mermaid_for_target(bundle_name, resources_resolved, target_name, target_data_resolved)
-            file_ext = "mmd"
-            render_func = run_mermaid
-
-        # Generate source file paths
-        source_file = f"{args.output}/source/{target_name}.{file_ext}"
-        png_file = f"{args.output}_{target_name}.png"
-
-        # Save the source file
-        os.makedirs(os.path.dirname(source_file), exist_ok=True)
-        with open(source_file, "w", encoding="utf-8") as f:
-            f.write(diagram_content)
-        print(f"[INFO] Diagram source saved to: {os.path.abspath(source_file)}")
-        
-        # Render the diagram
-        render_func(diagram_content, png_file)
-        print(f"[INFO] Generated diagram for environment '{target_name}': {os.path.abspath(png_file)}")
+    start = time.perf_counter()
+    state = None
+    if args.watch:
+        # Keep the parsed files in memory so that rebuilds only reparse what changed
+        state = BundleState(args.input, yaml_cache, merge_policies, jobs)
+        state.refresh()
+        load_state(bundle_runs[0], state, target_patterns)
+        timings["load_seconds"] = time.perf_counter() - start
+    else:
+        load_bundles(bundle_runs, yaml_cache, jobs, merge_policies)
+        for bundle_run in bundle_runs:
+            bundle_run.targets = select_targets(bundle_run.targets, target_patterns)
+        if args.root is not None:
+            timings["load_seconds"] = time.perf_counter() - start
+    for bundle_run in bundle_runs:
+        if bundle_run.error is not None:
+            print(f"[ERROR] {bundle_run.error}")
+    if args.root is None and bundle_runs[0].error is not None and not args.watch:
+        return 1
+
+    previous_manifest = None
+    if args.changed_since:
+        try:
+            previous_manifest = load_manifest(args.changed_since)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Failed to read manifest {args.changed_since}: {e}")
+            return 1
+
+    tasks = [
+        (bundle_run, target_name, target_data)
+        for bundle_run in bundle_runs if bundle_run.error is None
+        for target_name, target_data in bundle_run.targets.items()
+    ]
+    if target_patterns and not tasks and not args.watch:
+        print(f"[ERROR] No targets matching {', '.join(target_patterns)}")
+        return 1
+    workers = min(jobs, len(tasks)) or 1
+    renderer_pool = None
+    if args.renderer == "warm" and args.type not in ("svg", "html"):
+        renderer_pool = create_renderer_pool(args.type, workers, args.renderer_cmd, args.render_timeout)
+    render_cache = None
+    if not args.no_cache and args.type not in ("svg", "html"):
+        render_cache = RenderCache(
+            os.path.join(args.cache_dir, "render"),
+            args.render_cache_mb * 1024 * 1024,
+            renderer_version(args.type, args.renderer, args.renderer_cmd, os.path.join(args.cache_dir, "renderer_versions.json"))
+        )
+
+    try:
+        start = time.perf_counter()
+        failed = process_targets(args, tasks, workers, renderer_pool, render_cache, previous_manifest, job_patterns, profiles)
+        timings["targets_seconds"] = time.perf_counter() - start
+
+        # Job fingerprints for later --changed-since runs. A selection only
+        # covers part of the bundle, so it would make an incomplete manifest.
+        for bundle_run in bundle_runs:
+            if bundle_run.error is None and not target_patterns and not job_patterns:
+                write_manifest(bundle_run)
+
+        if args.root is not None:
+            index_file = os.path.join(os.path.dirname(args.output), "index.json")
+            write_index(index_file, args.root, bundle_runs)
+            print(f"[INFO] Index of {len(bundle_runs)} bundle(s) saved to: {os.path.abspath(index_file)}")
+            broken = [bundle_run.label for bundle_run in bundle_runs if bundle_run.error is not None]
+            if broken:
+                print(f"[ERROR] {len(broken)} of {len(bundle_runs)} bundle(s) failed to load: {', '.join(broken)}")
+
+        if failed:
+            print(f"[ERROR] {len(failed)} of {len(tasks)} environment(s) failed: {', '.join(failed)}")
+        exit_code = 1 if failed or any(bundle_run.error is not None for bundle_run in bundle_runs) else 0
+
+        if args.watch:
+            exit_code = watch_bundle(
+                args, bundle_runs[0], state, workers, renderer_pool, render_cache,
+                previous_manifest, target_patterns, job_patterns, profiles
+            )
+    finally:
+        if renderer_pool is not None:
+            renderer_pool.close()
+    return exit_code
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+fakeRenderer: A stand-in for the warm PlantUML / Mermaid renderers used by dabsVisualizer.
+
+It speaks the same stdin/stdout protocols as the real backends but returns a tiny
+placeholder PNG (or SVG, with -tsvg / -f svg) immediately, so the rendering pipeline can be exercised without a
+JVM or a headless browser:
+
+    python src/dabsVisualizer.py -i example/databricks.yml --renderer warm \
+        --renderer-cmd "python src/fakeRenderer.py"
+
+- With "-pipe -pipedelimitor <delimiter>" it behaves like `plantuml -pipe`: diagrams
+  are read up to @enduml and every image is followed by the delimiter and a newline.
+- Otherwise it behaves like mermaidRenderer.mjs: requests are "<length>\\n<source>",
+  responses "OK <length>\\n<png>" or "ERR <length>\\n<message>".
+
+A diagram containing FAKE_RENDER_ERROR is answered with an error, and the
+FAKE_RENDER_DELAY environment variable (seconds) simulates layout time.
+"""
+
+import sys
+import os
+import time
+import struct
+import zlib
+
+ERROR_MARKER = "FAKE_RENDER_ERROR"
+
+def placeholder_png():
+    """Returns a valid 1x1 grey PNG."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"\x00\x80"))
+        + chunk(b"IEND", b"")
+    )
+
+def placeholder_svg():
+    """Returns a minimal 1x1 SVG."""
+    return b'<svg xmlns="http://www.w3.org/2000/svg" width="1" height="1"/>'
+
+def placeholder(image_format):
+    return placeholder_svg() if image_format == "svg" else placeholder_png()
+
+def render(source, image_format="png"):
+    delay = float(os.environ.get("FAKE_RENDER_DELAY", "0"))
+    if delay:
+        time.sleep(delay)
+    if ERROR_MARKER in source:
+        raise ValueError(f"{ERROR_MARKER} found in diagram source")
+    return placeholder(image_format)
+
+def serve_plantuml_pipe(stdin, stdout, delimiter, image_format="png"):
+    lines = []
+    for raw_line in stdin:
+        line = raw_line.decode("utf-8")
+        lines.append(line)
+        if line.strip() != "@enduml":
+            continue
+        try:
+            image = render("".join(lines), image_format)
+        except ValueError as e:
+            # PlantUML reports syntax errors on stderr and still emits an image
+            print(f"ERROR\n{e}", file=sys.stderr, flush=True)
+            image = placeholder(image_format)
+        stdout.write(image + delimiter.encode("utf-8") + b"\n")
+        stdout.flush()
+        lines = []
+
+def serve_framed(stdin, stdout, image_format="png"):
+    while True:
+        header = stdin.readline()
+        if not header:
+            return
+        source = stdin.read(int(header)).decode("utf-8")
+        try:
+            status, data = "OK", render(source, image_format)
+        except ValueError as e:
+            status, data = "ERR", str(e).encode("utf-8")
+        stdout.write(f"{status} {len(data)}\n".encode("ascii") + data)
+        stdout.flush()
+
+def main():
+    args = sys.argv[1:]
+    if "-pipe" in args:
+        delimiter = args[args.index("-pipedelimitor") + 1] if "-pipedelimitor" in args else ""
+        image_format = "svg" if "-tsvg" in args else "png"
+        serve_plantuml_pipe(sys.stdin.buffer, sys.stdout.buffer, delimiter, image_format)
+    else:
+        image_format = args[args.index("-f") + 1] if "-f" in args else "png"
+        serve_framed(sys.stdin.buffer, sys.stdout.buffer, image_format)
+
+if __name__ == "__main__":
+    main()
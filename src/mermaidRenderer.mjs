@@ -0,0 +1,81 @@
+#!/usr/bin/env node
+/*
+ * mermaidRenderer: persistent Mermaid renderer used by dabsVisualizer.py (--renderer warm).
+ *
+ * Launches one headless browser through @mermaid-js/mermaid-cli and keeps it alive,
+ * rendering every diagram received on stdin to PNG (or SVG) bytes on stdout.
+ *
+ * Protocol (one request at a time):
+ *   request:  "<length>\n<mermaid source>"
+ *   response: "OK <length>\n<image bytes>" or "ERR <length>\n<error message>"
+ *
+ * Options: -t <theme> (default: dark), -f png|svg (default: png)
+ */
+import { execSync } from "node:child_process";
+import { createRequire } from "node:module";
+import path from "node:path";
+import { pathToFileURL } from "node:url";
+
+const themeIndex = process.argv.indexOf("-t");
+const theme = themeIndex !== -1 ? process.argv[themeIndex + 1] : "dark";
+const formatIndex = process.argv.indexOf("-f");
+const format = formatIndex !== -1 ? process.argv[formatIndex + 1] : "png";
+
+// mermaid-cli is normally installed globally (npm install -g @mermaid-js/mermaid-cli),
+// which ESM imports do not search, so look it up next to this script first and then
+// in the global node_modules.
+function resolveMermaidCli() {
+  const localRequire = createRequire(import.meta.url);
+  try {
+    return path.dirname(localRequire.resolve("@mermaid-js/mermaid-cli/package.json"));
+  } catch {
+    const globalRoot = execSync("npm root -g").toString().trim();
+    return path.join(globalRoot, "@mermaid-js", "mermaid-cli");
+  }
+}
+
+const mermaidCliDir = resolveMermaidCli();
+const cliRequire = createRequire(path.join(mermaidCliDir, "package.json"));
+const { renderMermaid } = await import(pathToFileURL(path.join(mermaidCliDir, "src", "index.js")).href);
+const puppeteer = (await import(pathToFileURL(cliRequire.resolve("puppeteer")).href)).default;
+
+const browser = await puppeteer.launch({ headless: "new" });
+
+function respond(status, data) {
+  process.stdout.write(`${status} ${data.length}\n`);
+  process.stdout.write(data);
+}
+
+async function renderOne(source) {
+  try {
+    const { data } = await renderMermaid(browser, source, format, {
+      mermaidConfig: { theme },
+      backgroundColor: "white",
+    });
+    respond("OK", Buffer.from(data));
+  } catch (error) {
+    respond("ERR", Buffer.from(String(error && error.message ? error.message : error), "utf-8"));
+  }
+}
+
+let buffer = Buffer.alloc(0);
+let pending = Promise.resolve();
+
+process.stdin.on("data", (chunk) => {
+  buffer = Buffer.concat([buffer, chunk]);
+  for (;;) {
+    const newline = buffer.indexOf(0x0a);
+    if (newline === -1) break;
+    const length = parseInt(buffer.subarray(0, newline).toString("ascii"), 10);
+    if (buffer.length < newline + 1 + length) break;
+    const source = buffer.subarray(newline + 1, newline + 1 + length).toString("utf-8");
+    buffer = buffer.subarray(newline + 1 + length);
+    // Keep responses in request order
+    pending = pending.then(() => renderOne(source));
+  }
+});
+
+process.stdin.on("end", async () => {
+  await pending;
+  await browser.close();
+});
@@ -0,0 +1,387 @@
+"""
+svgLayout: The layered layout and SVG writer behind dabsVisualizer's -t svg output.
+
+Nodes are assigned to layers along their longest path, edges spanning several
+layers are routed through dummy nodes (bundled per target and capped by a
+budget), crossings are reduced with barycenter sweeps and every component is
+written as one block of a standalone SVG document. Only the standard library
+is needed, so no renderer has to be installed.
+"""
+
+import collections
+import html
+import textwrap
+
+# Spacing of the built-in SVG layout, in pixels
+SVG_FONT_SIZE = 12
+SVG_CHAR_WIDTH = 7
+SVG_LINE_HEIGHT = 16
+SVG_NODE_PADDING = 10
+SVG_LAYER_GAP = 60
+SVG_NODE_GAP = 14
+SVG_COMPONENT_GAP = 30
+SVG_LABEL_WIDTH = 48
+# Rounds of barycenter sweeps (one down, one up) used for crossing reduction
+SVG_SWEEPS = 3
+# Dummy nodes a layout may add to route long edges, per node and edge of the
+# graph; long edges beyond this budget are drawn as straight lines
+SVG_DUMMY_BUDGET = 1
+# Node fill and stroke per class, matching the Mermaid classDefs
+SVG_STYLES = {
+    "job": ("#2C3E50", "#1A5276", "#FFFFFF"),
+    "task": ("#5D6D7E", "#2874A6", "#FFFFFF"),
+    "cluster": ("#7F8C8D", "#566573", "#FFFFFF"),
+    "param": ("#566573", "#2C3E50", "#E5E7E9"),
+    "changed": ("#D35400", "#F5B041", "#FFFFFF"),
+}
+
+class LayoutNode:
+    """A node of the layered layout. Dummy nodes route edges that span several layers."""
+    __slots__ = ("id", "lines", "style", "link", "width", "height", "layer", "order", "x", "y", "dummy")
+
+    def __init__(self, id, label="", style="task", link=None, dummy=False):
+        self.id = id
+        if dummy:
+            self.lines = []
+        elif len(label) <= SVG_LABEL_WIDTH and label.isprintable():
+            # What textwrap.wrap() returns for a label that fits on one line
+            self.lines = [label.rstrip()]
+        else:
+            self.lines = textwrap.wrap(label, SVG_LABEL_WIDTH) or [""]
+        self.style = style
+        self.link = link
+        self.dummy = dummy
+        self.width = 0 if dummy else max(len(line) for line in self.lines) * SVG_CHAR_WIDTH + 2 * SVG_NODE_PADDING
+        self.height = 0 if dummy else len(self.lines) * SVG_LINE_HEIGHT + SVG_NODE_PADDING
+        self.layer = 0
+        self.order = 0
+        self.x = 0.0
+        self.y = 0.0
+
+def _remove_cycles(count, successors):
+    """
+    Returns the set of (source, target) index pairs that close a cycle
+    (back edges of an iterative depth-first search). Reversing them makes the
+    graph acyclic.
+    """
+    state = [0] * count  # 0 = unvisited, 1 = on stack, 2 = done
+    back_edges = set()
+    for root in range(count):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if state[child] == 1:
+                    back_edges.add((node, child))
+                elif state[child] == 0:
+                    state[child] = 1
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    return back_edges
+
+def _count_crossings(upper, down, order, size):
+    """
+    Counts edge crossings between a layer and the next one (of size nodes):
+    the inversions of the target positions when edges are sorted by source
+    position, counted with a Fenwick tree in O(E log V).
+    """
+    if len(upper) < 2 or size < 2:
+        return 0
+    crossings = 0
+    seen = 0
+    tree = [0] * (size + 1)
+    for node in upper:
+        targets = [order[child] for child in down[node]]
+        for target in targets:
+            # Edges seen so far that end below this target cross it
+            position = target + 1
+            not_below = 0
+            while position:
+                not_below += tree[position]
+                position &= position - 1
+            crossings += seen - not_below
+        for target in targets:
+            position = target + 1
+            while position <= size:
+                tree[position] += 1
+                position += position & -position
+        seen += len(targets)
+    return crossings
+
+def layered_layout(nodes, edges):
+    """
+    Sugiyama-style layered layout, left to right.
+
+    The graph is made acyclic by reversing DFS back edges, nodes are assigned
+    to layers by longest path, edges spanning several layers are routed
+    through dummy nodes, crossings are reduced with alternating barycenter
+    sweeps (until a round no longer reduces them, keeping the best ordering
+    seen) and nodes are finally pulled
+    towards their neighbours without overlapping.
+
+    Long edges into the same node (e.g. every task using a shared cluster)
+    share one chain of dummy nodes, and chains are only added while they fit
+    in SVG_DUMMY_BUDGET dummies per node and edge; the remaining long edges
+    are drawn straight. The layered graph therefore stays linear in the size
+    of the input, and each sweep, including its crossing count, takes
+    O(E log V).
+
+    nodes is a list of LayoutNode, edges a list of (source id, target id).
+    Positions are stored on the nodes (x, y is the top-left corner). Returns
+    (routes, width, height), with one list of (x, y) points per edge.
+    """
+    index = {node.id: position for position, node in enumerate(nodes)}
+    count = len(nodes)
+    edge_list = []
+    seen_edges = set()
+    for source, target in edges:
+        pair = (index[source], index[target])
+        if pair[0] != pair[1] and pair not in seen_edges:
+            seen_edges.add(pair)
+            edge_list.append(pair)
+
+    successors = [[] for _ in range(count)]
+    for source, target in edge_list:
+        successors[source].append(target)
+    back_edges = _remove_cycles(count, successors)
+    dag_edges = [(t, s) if (s, t) in back_edges else (s, t) for s, t in edge_list]
+
+    # Longest-path layering in topological order
+    successors = [[] for _ in range(count)]
+    in_degree = [0] * count
+    for source, target in dag_edges:
+        successors[source].append(target)
+        in_degree[target] += 1
+    layer = [0] * count
+    ready = collections.deque(position for position in range(count) if in_degree[position] == 0)
+    while ready:
+        node = ready.popleft()
+        for child in successors[node]:
+            layer[child] = max(layer[child], layer[node] + 1)
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                ready.append(child)
+
+    # Long edges into the same node are bundled into one chain of dummy nodes,
+    # one per layer between the earliest source and the target. The cheapest
+    # bundles are added first, as long as the dummy budget allows.
+    all_nodes = list(nodes)
+    bundles = {}
+    for source, target in dag_edges:
+        if layer[target] - layer[source] > 1:
+            bundles.setdefault(target, []).append(source)
+    budget = SVG_DUMMY_BUDGET * (count + len(dag_edges))
+    chain_layers = {}
+    for target, sources in sorted(bundles.items(), key=lambda item: layer[item[0]] - min(layer[s] for s in item[1])):
+        first = min(layer[source] for source in sources) + 1
+        if layer[target] - first > budget:
+            break
+        budget -= layer[target] - first
+        # dummy per layer, indexed by layer - first
+        chain = []
+        for step in range(first, layer[target]):
+            all_nodes.append(LayoutNode(("dummy", len(all_nodes)), dummy=True))
+            layer.append(step)
+            chain.append(len(all_nodes) - 1)
+        chain_layers[target] = (first, chain)
+
+    total = len(all_nodes)
+    down = [[] for _ in range(total)]
+    up = [[] for _ in range(total)]
+    for first, chain in chain_layers.values():
+        for source, target in zip(chain, chain[1:]):
+            down[source].append(target)
+            up[target].append(source)
+    for target, (first, chain) in chain_layers.items():
+        down[chain[-1]].append(target)
+        up[target].append(chain[-1])
+    # Routes through the layout graph per DAG edge; straight edges have no dummies
+    paths = []
+    linked = set()
+    for source, target in dag_edges:
+        if target in chain_layers and layer[target] - layer[source] > 1:
+            first, chain = chain_layers[target]
+            path = [source] + chain[layer[source] + 1 - first:] + [target]
+        else:
+            path = [source, target]
+        if len(path) > 2 or layer[target] - layer[source] == 1:
+            # Several sources may join a bundle at the same dummy
+            if (source, path[1]) not in linked:
+                linked.add((source, path[1]))
+                down[source].append(path[1])
+                up[path[1]].append(source)
+        paths.append(path)
+
+    layers = [[] for _ in range(max(layer, default=0) + 1)]
+    for position in range(total):
+        layers[layer[position]].append(position)
+    order = [0] * total
+    for members in layers:
+        for position, node in enumerate(members):
+            order[node] = position
+
+    def crossings():
+        return sum(_count_crossings(layers[number], down, order, len(layers[number + 1])) for number in range(len(layers) - 1))
+
+    def sweep(layer_numbers, neighbours):
+        for number in layer_numbers:
+            members = layers[number]
+            keys = {}
+            for node in members:
+                adjacent = neighbours[node]
+                if adjacent:
+                    total = 0
+                    for neighbour in adjacent:
+                        total += order[neighbour]
+                    keys[node] = total / len(adjacent)
+                else:
+                    keys[node] = order[node]
+            members.sort(key=keys.__getitem__)
+            for position, node in enumerate(members):
+                order[node] = position
+
+    best = crossings()
+    best_layers = [list(members) for members in layers]
+    for _ in range(SVG_SWEEPS):
+        if best == 0:
+            break
+        sweep(range(1, len(layers)), up)
+        sweep(range(len(layers) - 2, -1, -1), down)
+        current = crossings()
+        if current >= best:
+            break
+        best = current
+        best_layers = [list(members) for members in layers]
+    layers = best_layers
+    for members in layers:
+        for position, node in enumerate(members):
+            order[node] = position
+
+    # Horizontal position per layer, vertical position pulled towards neighbours
+    x = 0
+    for members in layers:
+        layer_width = max((all_nodes[node].width for node in members), default=0)
+        for node in members:
+            all_nodes[node].x = x + (layer_width - all_nodes[node].width) / 2
+        x += layer_width + SVG_LAYER_GAP
+    centers = [0.0] * total
+    for members in layers:
+        y = 0.0
+        for node in members:
+            centers[node] = y + all_nodes[node].height / 2
+            y += all_nodes[node].height + SVG_NODE_GAP
+    for number, members in enumerate(layers):
+        if number == 0:
+            continue
+        desired = [
+            sum(centers[n] for n in up[node]) / len(up[node]) if up[node] else centers[node]
+            for node in members
+        ]
+        _place_layer(all_nodes, members, desired, centers)
+    for number in range(len(layers) - 2, -1, -1):
+        members = layers[number]
+        desired = [
+            sum(centers[n] for n in down[node]) / len(down[node]) if down[node] else centers[node]
+            for node in members
+        ]
+        _place_layer(all_nodes, members, desired, centers)
+
+    top = min((centers[node] - all_nodes[node].height / 2 for node in range(total)), default=0)
+    for node in range(total):
+        all_nodes[node].y = centers[node] - all_nodes[node].height / 2 - top
+        all_nodes[node].layer = layer[node]
+        all_nodes[node].order = order[node]
+
+    routes = []
+    for (source, target), path in zip(edge_list, paths):
+        points = [_anchor(all_nodes[path[0]], right=True)]
+        points.extend(_anchor(all_nodes[node], right=False) for node in path[1:-1])
+        points.append(_anchor(all_nodes[path[-1]], right=False))
+        if (source, target) in back_edges:
+            points.reverse()
+        routes.append(points)
+    width = max((node.x + node.width for node in nodes), default=0)
+    height = max((node.y + node.height for node in all_nodes), default=0)
+    return routes, width, height
+
+def _place_layer(all_nodes, members, desired, centers):
+    """
+    Moves the nodes of one layer as close to their desired centers as
+    possible while keeping their order and the minimum gap between them.
+    """
+    positions = []
+    previous_bottom = None
+    for node, target in zip(members, desired):
+        half = all_nodes[node].height / 2
+        center = target if previous_bottom is None else max(target, previous_bottom + SVG_NODE_GAP + half)
+        positions.append(center)
+        previous_bottom = center + half
+    for position in range(len(members) - 2, -1, -1):
+        node, below = members[position], members[position + 1]
+        limit = positions[position + 1] - all_nodes[below].height / 2 - SVG_NODE_GAP - all_nodes[node].height / 2
+        positions[position] = min(positions[position], limit)
+    for node, center in zip(members, positions):
+        centers[node] = center
+
+def _anchor(node, right):
+    """Edge attachment point on the left or right side of a node (a dummy's center)."""
+    x = node.x + (node.width if right else 0)
+    return (x, node.y + node.height / 2)
+
+def _svg_text(value):
+    return html.escape(str(value), quote=True)
+
+def emit_svg_components(title, components):
+    """
+    Lays out each (nodes, edges) component with layered_layout(), stacks them
+    vertically and returns the SVG document.
+    """
+    body = []
+    y_offset = SVG_LINE_HEIGHT * 2 + SVG_COMPONENT_GAP
+    width = len(title) * SVG_CHAR_WIDTH
+    for nodes, edges in components:
+        routes, component_width, component_height = layered_layout(nodes, edges)
+        width = max(width, component_width)
+        body.append(f'<g transform="translate(0,{y_offset:.1f})">')
+        body.append(
+            f'<rect class="frame" x="-{SVG_NODE_PADDING}" y="-{SVG_NODE_PADDING}" '
+            f'width="{component_width + 2 * SVG_NODE_PADDING:.1f}" height="{component_height + 2 * SVG_NODE_PADDING:.1f}"/>'
+        )
+        for points in routes:
+            path = " ".join(f"{px:.1f},{py:.1f}" for px, py in points)
+            body.append(f'<polyline class="edge" points="{path}"/>')
+        for node in nodes:
+            fill, stroke, color = SVG_STYLES[node.style]
+            element = (
+                f'<g class="node {node.style}"><rect x="{node.x:.1f}" y="{node.y:.1f}" width="{node.width:.1f}" '
+                f'height="{node.height:.1f}" rx="6" fill="{fill}" stroke="{stroke}"/>'
+            )
+            for line_number, line in enumerate(node.lines):
+                text_y = node.y + SVG_NODE_PADDING / 2 + (line_number + 0.75) * SVG_LINE_HEIGHT
+                element += f'<text x="{node.x + SVG_NODE_PADDING:.1f}" y="{text_y:.1f}" fill="{color}">{_svg_text(line)}</text>'
+            element += "</g>"
+            if node.link:
+                element = f'<a href="{_svg_text(node.link)}">{element}</a>'
+            body.append(element)
+        body.append("</g>")
+        y_offset += component_height + 2 * SVG_NODE_PADDING + SVG_COMPONENT_GAP
+
+    width += 2 * SVG_COMPONENT_GAP
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{y_offset:.0f}" '
+        f'viewBox="-{SVG_COMPONENT_GAP} 0 {width:.0f} {y_offset:.0f}" font-family="sans-serif" font-size="{SVG_FONT_SIZE}">',
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" orient="auto">'
+        '<path d="M0,0 L10,5 L0,10 z" fill="#566573"/></marker></defs>',
+        '<style>.edge{fill:none;stroke:#566573;stroke-width:1.2;marker-end:url(#arrow)}'
+        '.frame{fill:#F8F9F9;stroke:#D5D8DC}</style>',
+        f'<text x="0" y="{SVG_LINE_HEIGHT * 1.5:.1f}" font-size="{SVG_FONT_SIZE + 4}" font-weight="bold">{_svg_text(title)}</text>',
+    ]
+    lines.extend(body)
+    lines.append("</svg>")
+    return "\n".join(lines)
@@ -0,0 +1,369 @@
+"""Tests for dabsVisualizer."""
+
+import datetime
+import json
+import os
+import sys
+
+import pytest
+
+import dabsVisualizer
+from bundleGenerator import generate_bundle
+from dabsVisualizer import (
+    BundleRun,
+    BundleState,
+    DiagramError,
+    InterpolationError,
+    Interpolator,
+    MergeConflictError,
+    ResourceMerger,
+    YamlCache,
+    build_job,
+    create_interpolator,
+    create_renderer_pool,
+    expand_includes,
+    load_bundle_yaml,
+    load_bundles,
+)
+
+FAKE_RENDERER = os.path.join(os.path.dirname(os.path.abspath(dabsVisualizer.__file__)), "fakeRenderer.py")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def test_interpolator_resolves_nested_variable_references():
+    interpolator = create_interpolator(
+        "my_bundle", "dev", {"variables": {"env": "development"}},
+        {
+            "env": {"default": "prod"},
+            "schema": {"default": "${bundle.name}_${var.env}"},
+            "table": {"default": "${var.schema}.events"},
+            "workers": {"default": 4},
+        },
+    )
+    resolved = interpolator.resolve({"tasks": [{"table": "${var.table}", "workers": "${var.workers}", "target": "${bundle.target}"}]})
+    assert resolved == {"tasks": [{"table": "my_bundle_development.events", "workers": 4, "target": "dev"}]}
+
+def test_interpolator_substitutes_inside_quoted_values():
+    interpolator = Interpolator({"bundle.target": "dev"}, {"name": "it's ${bundle.target}"})
+    assert interpolator.resolve("--name='${var.name}'") == "--name='it's dev'"
+    assert interpolator.resolve('"${var.name}"') == '"it\'s dev"'
+
+def test_interpolator_leaves_unknown_references_and_shares_unchanged_subtrees():
+    interpolator = Interpolator({}, {})
+    tree = {"branch": "${bundle.git.branch}", "missing": "${var.missing}", "nested": {"plain": "value"}}
+    resolved = interpolator.resolve(tree)
+    assert resolved is tree
+    assert resolved["branch"] == "${bundle.git.branch}"
+
+def test_interpolator_reports_variable_cycles():
+    interpolator = Interpolator({}, {"a": "${var.b}", "b": "x-${var.c}", "c": "${var.a}"})
+    with pytest.raises(InterpolationError, match=r"var\.a -> var\.b -> var\.c -> var\.a"):
+        interpolator.resolve("${var.a}")
+
+def test_merger_deep_merges_jobs_and_overrides_other_resources():
+    logged = []
+    merger = ResourceMerger(log=logged.append)
+    merger.add({"jobs": {"etl": {"name": "ETL", "tasks": [{"task_key": "extract"}]}}, "pipelines": {"p": {"name": "one"}}}, "a.yml")
+    merger.add({"jobs": {"etl": {"tags": {"team": "data"}, "tasks": [{"task_key": "load"}]}}, "pipelines": {"p": {"name": "two"}}}, "b.yml")
+    job = merger.resources["jobs"]["etl"]
+    assert job["tags"] == {"team": "data"}
+    assert [task["task_key"] for task in job["tasks"]] == ["extract", "load"]
+    assert merger.resources["pipelines"]["p"] == {"name": "two"}
+    assert merger.conflicts == [("pipelines.p", "a.yml", "b.yml")]
+    assert "keeping b.yml" in logged[0]
+
+def test_merger_reports_duplicate_task_key_across_files():
+    logged = []
+    merger = ResourceMerger(log=logged.append)
+    merger.add({"jobs": {"etl": {"tasks": [{"task_key": "extract", "notebook_task": {"notebook_path": "a.py"}}]}}}, "a.yml")
+    merger.add({"jobs": {"etl": {"tasks": [{"task_key": "extract", "notebook_task": {"notebook_path": "b.py"}}]}}}, "b.yml")
+    tasks = merger.resources["jobs"]["etl"]["tasks"]
+    assert len(tasks) == 1
+    assert tasks[0]["notebook_task"]["notebook_path"] == "a.py"
+    assert merger.conflicts == [("jobs.etl.tasks[extract].notebook_task.notebook_path", "a.yml", "b.yml")]
+    assert "keeping a.yml" in logged[0]
+
+def test_merger_keep_and_error_policies():
+    merger = ResourceMerger({"jobs": "keep"}, log=lambda line: None)
+    merger.add({"jobs": {"etl": {"name": "first"}}}, "a.yml")
+    merger.add({"jobs": {"etl": {"name": "second"}}}, "b.yml")
+    assert merger.resources["jobs"]["etl"] == {"name": "first"}
+    assert merger.conflicts == [("jobs.etl", "a.yml", "b.yml")]
+
+    merger = ResourceMerger({"*": "error"}, log=lambda line: None)
+    merger.add({"pipelines": {"p": {"name": "one"}}}, "a.yml")
+    merger.add({"pipelines": {"p": {"name": "one"}}}, "b.yml")
+    with pytest.raises(MergeConflictError, match="a.yml and c.yml"):
+        merger.add({"pipelines": {"p": {"name": "two"}}}, "c.yml")
+
+def job_with_tasks(*tasks):
+    return build_job("job", {"tasks": [
+        {"task_key": key, "depends_on": [{"task_key": dependency} for dependency in dependencies]}
+        for key, dependencies in tasks
+    ]})
+
+def test_analyze_dag_depth_width_and_chain():
+    analysis = job_with_tasks(
+        ("extract", []), ("clean", ["extract"]), ("enrich", ["extract"]), ("audit", ["extract"]),
+        ("load", ["clean", "enrich"]), ("report", ["load"]),
+    ).analysis
+    assert analysis.depth == 4
+    assert analysis.chain == ["extract", "clean", "load", "report"]
+    assert analysis.width == 3
+    assert analysis.cycles == []
+    assert analysis.unresolved == []
+
+def test_analyze_dag_cycles_and_unresolved_dependencies():
+    analysis = job_with_tasks(
+        ("start", []), ("a", ["start", "c"]), ("b", ["a"]), ("c", ["b"]), ("self", ["self"]), ("orphan", ["missing"]),
+    ).analysis
+    assert analysis.cycles == [["a", "b", "c"], ["self"]]
+    assert analysis.unresolved == [("orphan", "missing")]
+    assert analysis.order == ["start", "orphan"]
+    assert analysis.depth == 1
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    # Make sure the change is visible even on file systems with coarse mtimes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def test_bundle_state_reparses_only_changed_files(tmp_path):
+    main = str(tmp_path / "databricks.yml")
+    first = str(tmp_path / "resources" / "a.yml")
+    second = str(tmp_path / "resources" / "b.yml")
+    write(main, "bundle:\n  name: demo\ninclude:\n  - resources/*.yml\ntargets:\n  dev: {}\n")
+    write(first, "resources:\n  jobs:\n    a:\n      name: A\n")
+    write(second, "resources:\n  jobs:\n    b:\n      name: B\n")
+
+    state = BundleState(main)
+    assert sorted(state.refresh()) == sorted([main, first, second])
+    bundle_name, resources, targets, _ = state.load()
+    assert bundle_name == "demo"
+    assert sorted(resources["jobs"]) == ["a", "b"]
+    assert list(targets) == ["dev"]
+    assert state.refresh() == []
+
+    write(first, "resources:\n  jobs:\n    a:\n      name: Renamed\n")
+    os.remove(second)
+    assert sorted(state.refresh()) == sorted([first, second])
+    _, resources, _, _ = state.load()
+    assert resources["jobs"] == {"a": {"name": "Renamed"}}
+    # load() merges pickled copies, so loading twice gives the same result
+    assert state.load()[1] == resources
+
+def test_yaml_cache_stores_documents_as_tagged_json(tmp_path):
+    path = str(tmp_path / "job.yml")
+    write(path, (
+        "released: 2024-05-01\n"
+        "deployed: 2024-05-01 12:30:00+02:00\n"
+        "blob: !!binary aGVsbG8=\n"
+        "owners: !!set {alice, bob}\n"
+        "retries: {1: fast, 2024-01-01: new_year}\n"
+        "tagged: {'!yaml': date}\n"
+    ))
+    expected = dabsVisualizer.parse_yaml_file(path)
+    assert expected["deployed"].tzinfo is not None
+
+    cache_dir = str(tmp_path / "cache")
+    assert YamlCache(cache_dir).load(path) == expected
+    entries = os.listdir(cache_dir)
+    assert len(entries) == 1 and entries[0].endswith(".json")
+    with open(os.path.join(cache_dir, entries[0]), encoding="utf-8") as f:
+        assert json.load(f)["data"]["released"] == {"!yaml": "date", "value": "2024-05-01"}
+    cached = YamlCache(cache_dir).load(path)
+    assert cached == expected
+    assert cached["retries"] == {1: "fast", datetime.date(2024, 1, 1): "new_year"}
+    assert cached["blob"] == b"hello"
+
+@pytest.mark.parametrize("diagram_type, source", [
+    ("plantuml", "@startuml\nrectangle job\n@enduml\n"),
+    ("mermaid", "flowchart TD\n    job\n"),
+])
+def test_warm_renderer_round_trip_and_errors(diagram_type, source):
+    pool = create_renderer_pool(diagram_type, 1, f'"{sys.executable}" "{FAKE_RENDERER}"', timeout=30)
+    try:
+        assert pool.render(source).startswith(PNG_SIGNATURE)
+        assert pool.render(source, "svg").startswith(b"<svg")
+        process = pool._renderers[0].process
+        with pytest.raises(DiagramError, match="FAKE_RENDER_ERROR"):
+            pool.render(source.replace("job", "FAKE_RENDER_ERROR"))
+        # A rejected diagram does not cost the renderer process
+        assert pool.render(source).startswith(PNG_SIGNATURE)
+        assert pool._renderers[0].process is process
+    finally:
+        pool.close()
+
+def test_warm_renderer_timeout_restarts_the_process(monkeypatch):
+    monkeypatch.setenv("FAKE_RENDER_DELAY", "5")
+    pool = create_renderer_pool("plantuml", 1, f'"{sys.executable}" "{FAKE_RENDERER}"', timeout=0.5)
+    try:
+        with pytest.raises(dabsVisualizer.RendererError, match="did not answer within"):
+            pool.render("@startuml\nrectangle job\n@enduml\n")
+        assert pool._renderers[0].process is None
+    finally:
+        pool.close()
+
+def test_root_run_records_empty_databricks_yml_as_failed_bundle(tmp_path):
+    valid = str(tmp_path / "valid" / "databricks.yml")
+    empty = str(tmp_path / "empty" / "databricks.yml")
+    write(valid, "bundle:\n  name: valid\ntargets:\n  dev: {}\n")
+    write(empty, "")
+    bundle_runs = [BundleRun(path, str(tmp_path / "out"), label, {}) for path, label in ((valid, "valid"), (empty, "empty"))]
+    load_bundles(bundle_runs, None, 1, {})
+    assert bundle_runs[0].error is None
+    assert bundle_runs[0].graph.bundle_name == "valid"
+    assert bundle_runs[1].error == f"{empty} is empty or not a YAML mapping"
+
+def test_select_jobs_builds_only_the_selected_jobs():
+    def run_job(job_id):
+        return {"task_key": f"run_{job_id}", "run_job_task": {"job_id": f"${{resources.jobs.{job_id}.id}}"}}
+    resources = {"jobs": {
+        "ingest": {"tasks": [{"task_key": "load"}]},
+        "train": {"tasks": [run_job("ingest"), {"task_key": "fit", "depends_on": [{"task_key": "run_ingest"}]}]},
+        "unrelated": {"tasks": [{"task_key": "noop"}]},
+    }}
+    graph = dabsVisualizer.BundleGraph("demo", resources)
+    target_data = {"resources": {"jobs": {"report": {"tasks": [run_job("train")]}}}}
+    job_ids = graph.select_jobs(target_data, ["rep*"], with_upstream=True)
+    assert job_ids == ["ingest", "train", "report"]
+    target_graph = graph.for_target("dev", target_data, job_ids=job_ids)
+    assert list(target_graph.jobs) == ["ingest", "train", "report"]
+    assert target_graph.jobs["train"].run_jobs == ["ingest"]
+    # Neither selecting nor building the target graph touched the other job
+    assert sorted(graph._jobs) == ["ingest", "train"]
+
+def test_plantuml_version_is_only_queried_again_after_an_upgrade(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    jar = tmp_path / "share" / "plantuml.jar"
+    calls = tmp_path / "calls"
+    write(str(jar), "jar")
+    write(str(bin_dir / "plantuml"), f'#!/bin/sh\necho run >> "{calls}"\necho "PlantUML version 1.2024.7"\n# exec java -jar "{jar}" "$@"\n')
+    os.chmod(bin_dir / "plantuml", 0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    versions_file = str(tmp_path / "cache" / "renderer_versions.json")
+
+    for _ in range(3):
+        assert dabsVisualizer.renderer_version("plantuml", "warm", None, versions_file) == "PlantUML version 1.2024.7"
+    assert calls.read_text().count("run") == 1
+    # Replacing the jar behind the unchanged wrapper script counts as an upgrade
+    write(str(jar), "new jar")
+    dabsVisualizer.renderer_version("plantuml", "warm", None, versions_file)
+    assert calls.read_text().count("run") == 2
+
+def test_expand_includes_keeps_each_file_once_in_pattern_order(tmp_path):
+    for name in ("jobs/b.yml", "jobs/a.yml", "jobs/nested/c.yml", "shared/d.yml", "notes.txt"):
+        write(str(tmp_path / name), "resources: {}\n")
+    main_dir = str(tmp_path)
+    files = expand_includes(main_dir, ["jobs/b.yml", "jobs/*.yml", "**/*.yml", "jobs/nested/c.yml", "missing/*.yml"])
+    assert [os.path.relpath(path, main_dir) for path in files] == [
+        os.path.join("jobs", "b.yml"),
+        os.path.join("jobs", "a.yml"),
+        os.path.join("jobs", "nested", "c.yml"),
+        os.path.join("shared", "d.yml"),
+    ]
+
+def test_parallel_load_matches_serial_load(tmp_path):
+    files = dabsVisualizer.PARALLEL_PARSE_MIN_FILES * 2
+    main = generate_bundle(str(tmp_path / "bundle"), files=files, jobs=files * 2, tasks=5, targets=2, variables=5)
+    assert len(expand_includes(str(tmp_path / "bundle"), ["resources/**/*.yml"])) >= dabsVisualizer.PARALLEL_PARSE_MIN_FILES
+    serial = load_bundle_yaml(main, workers=1, merge_policies={})
+    parallel = load_bundle_yaml(main, workers=4, merge_policies={})
+    assert json.dumps(parallel, default=str) == json.dumps(serial, default=str)
+
+def fingerprint_bundle():
+    def run_job(job_id):
+        return {"task_key": f"run_{job_id}", "run_job_task": {"job_id": f"${{resources.jobs.{job_id}.id}}"}}
+    resources = {"jobs": {
+        "orchestrate": {"name": "Orchestrate", "tasks": [run_job("transform")]},
+        "transform": {"name": "Transform", "tasks": [
+            {"task_key": "main", "notebook_task": {"notebook_path": "${var.notebook}"}},
+            run_job("publish"),
+        ]},
+        "publish": {"name": "Publish", "tasks": [{"task_key": "push"}]},
+        "unrelated": {"name": "Unrelated", "tasks": [{"task_key": "noop"}]},
+    }}
+    variables = {"notebook": {"default": "transform_v1.py"}}
+    return dabsVisualizer.BundleGraph("demo", resources), variables
+
+def target_fingerprints(graph, variables, target_data):
+    interpolator = create_interpolator(graph.bundle_name, "dev", target_data, variables)
+    return dabsVisualizer.job_fingerprints(graph.for_target("dev", interpolator.resolve(target_data), interpolator))
+
+def test_fingerprints_are_stable_and_follow_resolved_variables():
+    first = target_fingerprints(*fingerprint_bundle(), {})
+    assert target_fingerprints(*fingerprint_bundle(), {}) == first
+    changed = target_fingerprints(*fingerprint_bundle(), {"variables": {"notebook": "transform_v2.py"}})
+    assert [job_id for job_id in first if changed[job_id] != first[job_id]] == ["transform"]
+
+def test_changed_since_draws_the_changed_job_and_its_run_job_neighbours(tmp_path):
+    graph, variables = fingerprint_bundle()
+    previous = target_fingerprints(graph, variables, {})
+    output = str(tmp_path / "out")
+    result = dabsVisualizer.process_target(
+        graph, variables, "dev", {"variables": {"notebook": "transform_v2.py"}}, "svg", output,
+        previous_fingerprints=previous
+    )
+    assert result.success
+    assert "[INFO] Changed jobs in environment 'dev': transform" in result.log_lines
+    (image_file, diagram), = result.diagrams.items()
+    assert image_file == f"{output}_dev_changed.svg"
+    for name in ("Orchestrate", "Transform", "Publish"):
+        assert name in diagram
+    assert "Unrelated" not in diagram
+
+    unchanged = dabsVisualizer.process_target(graph, variables, "dev", {}, "svg", output, previous_fingerprints=previous)
+    assert unchanged.success and not unchanged.diagrams
+
+def sorted_matches(matches):
+    return sorted(matches, key=lambda match: sorted(match.items()))
+
+def test_query_index_lookup():
+    cluster = {"spark_version": "15.4.x-scala2.12", "node_type_id": "${var.node_type}", "num_workers": 2}
+    resources = {"jobs": {
+        "ingest": {
+            "name": "Ingest",
+            "job_clusters": [{"job_cluster_key": "main", "new_cluster": cluster}],
+            "email_notifications": {"on_failure": ["oncall@example.com"]},
+            "tasks": [
+                {"task_key": "extract", "notebook_task": {"notebook_path": "/Shared/extract"}},
+                {"task_key": "load", "depends_on": [{"task_key": "extract"}],
+                 "python_wheel_task": {"package_name": "loader", "entry_point": "main"},
+                 "libraries": [{"whl": "dist/loader-1.0-py3-none-any.whl"}],
+                 "email_notifications": {"on_success": ["oncall@example.com"]}},
+            ],
+        },
+        "report": {
+            "name": "Report",
+            "tasks": [
+                {"task_key": "extract", "existing_cluster_id": "shared-1",
+                 "notebook_task": {"notebook_path": "/Shared/extract"}},
+                {"task_key": "publish", "depends_on": [{"task_key": "extract"}]},
+            ],
+        },
+    }}
+    graph = dabsVisualizer.BundleGraph("demo", resources)
+    variables = {"node_type": {"default": "m7g.large"}}
+    interpolator = create_interpolator(graph.bundle_name, "dev", {}, variables)
+    index = dabsVisualizer.QueryIndex(graph.for_target("dev", {}, interpolator))
+
+    assert index.lookup("cluster", "node_type_id=m7g.large") == [{"job": "ingest"}]
+    assert index.lookup("cluster", "spark_version=15.4.x-scala2.12") == [{"job": "ingest"}]
+    assert index.lookup("cluster", "existing_cluster_id=shared-1") == [{"job": "report"}]
+    assert index.lookup("cluster", "node_type_id=${var.node_type}") == []
+    assert sorted_matches(index.lookup("notebook", "/Shared/extract")) == [
+        {"job": "ingest", "task": "extract"}, {"job": "report", "task": "extract"}
+    ]
+    assert index.lookup("wheel", "loader") == [{"job": "ingest", "task": "load"}]
+    assert index.lookup("wheel", "dist/loader-1.0-py3-none-any.whl") == [{"job": "ingest", "task": "load"}]
+    assert index.lookup("dependents", "ingest.extract") == [{"job": "ingest", "task": "load"}]
+    assert sorted_matches(index.lookup("dependents", "extract")) == [
+        {"job": "ingest", "task": "load"}, {"job": "report", "task": "publish"}
+    ]
+    assert sorted_matches(index.lookup("recipient", "oncall@example.com")) == [
+        {"job": "ingest", "task": "load", "type": "on_success"}, {"job": "ingest", "type": "on_failure"}
+    ]
+    assert index.lookup("recipient", "nobody@example.com") == []
+    with pytest.raises(ValueError):
+        index.lookup("owner", "someone")
@@ -0,0 +1,65 @@
+"""Tests for the layered layout behind -t svg."""
+
+import random
+
+import dabsVisualizer
+import svgLayout
+from bundleGenerator import generate_task
+from dabsVisualizer import emit_svg
+from svgLayout import LayoutNode, layered_layout
+
+def test_routes_connect_their_nodes_from_left_to_right():
+    rng = random.Random(0)
+    for _ in range(200):
+        count = rng.randint(2, 40)
+        nodes = [LayoutNode(number, f"node {number}") for number in range(count)]
+        edges = [(rng.randrange(count), rng.randrange(count)) for _ in range(rng.randint(0, 3 * count))]
+        routes, _, _ = layered_layout(nodes, edges)
+        unique_edges = list(dict.fromkeys((source, target) for source, target in edges if source != target))
+        assert len(routes) == len(unique_edges)
+        for (source, target), points in zip(unique_edges, routes):
+            # Back edges are routed from target to source
+            if points[0] != svgLayout._anchor(nodes[source], right=True):
+                points = points[::-1]
+                source, target = target, source
+            assert points[0] == svgLayout._anchor(nodes[source], right=True)
+            assert points[-1] == svgLayout._anchor(nodes[target], right=False)
+            assert [x for x, _ in points] == sorted(x for x, _ in points)
+
+def test_long_edges_into_one_node_share_dummy_nodes():
+    # Every task of a chain uses the cluster drawn after the last task: one
+    # dummy per layer between the first task and the cluster, not one per edge and layer
+    nodes = [LayoutNode(("task", number)) for number in range(50)] + [LayoutNode("cluster")]
+    edges = [(("task", number), ("task", number + 1)) for number in range(49)]
+    edges += [(("task", number), "cluster") for number in range(50)]
+    routes, _, _ = layered_layout(nodes, edges)
+    dummies = {point for points in routes for point in points[1:-1]}
+    assert len(dummies) == 49
+
+def single_job_graph(task_count):
+    rng = random.Random(0)
+    variables = [f"var_{number}" for number in range(5)]
+    tasks = [generate_task(rng, 0, number, variables) for number in range(task_count)]
+    return dabsVisualizer.BundleGraph("bench", {"jobs": {"job": {"name": "job", "tasks": tasks}}}).for_target("dev", {})
+
+def layout_size(graph, monkeypatch):
+    # Nodes, edges and distinct dummy points of every component emit_svg lays out
+    sizes = []
+    def recording_layout(nodes, edges):
+        routes, width, height = layered_layout(nodes, edges)
+        dummies = {point for points in routes for point in points[1:-1]}
+        sizes.append((len(nodes), len(edges), len(dummies)))
+        return routes, width, height
+    monkeypatch.setattr(svgLayout, "layered_layout", recording_layout)
+    emit_svg(graph)
+    return tuple(map(sum, zip(*sizes)))
+
+def test_large_single_job_stays_linear_in_size(monkeypatch):
+    # One dummy chain per long edge made the layout graph of this job grow
+    # quadratically; the layout has to stay within the dummy budget instead
+    small = layout_size(single_job_graph(750), monkeypatch)
+    large = layout_size(single_job_graph(3000), monkeypatch)
+    for nodes, edges, dummies in (small, large):
+        assert dummies <= svgLayout.SVG_DUMMY_BUDGET * (nodes + edges)
+    # Four times the tasks, so about four times the nodes, edges and dummies
+    assert all(large_count <= 5 * small_count for small_count, large_count in zip(small, large))